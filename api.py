@@ -0,0 +1,339 @@
+"""API HTTP/JSON das previsões, sem Streamlit.
+
+Aplicação ASGI sem dependências além das do aplicativo, para os sistemas
+que hoje leem o painel. Usa a mesma carga (``consultas.consulta_previsoes``,
+com a atualização incremental de ``versoes``), os mesmos filtros e a mesma
+geometria do ``app.py``. Rotas (só ``GET``/``HEAD``):
+
+* ``/opcoes``: valores de cada filtro e regiões disponíveis;
+* ``/previsoes``: previsões com a média histórica;
+* ``/desvios``: percentual e diferença em relação à média histórica, com as
+  mesmas regras do mapa "Percentual";
+* ``/geojson``: GeoJSON dos municípios da região; sem ``tolerancia`` (uma de
+  ``geometria.TOLERANCIAS``) nem ``altura``, o original;
+* ``/topojson``: a mesma geometria em TopoJSON quantizado, com as divisas
+  compartilhadas; sem ``tolerancia``, a do mapa do aplicativo;
+* ``/municipio``: município que contém ``lon``/``lat``.
+
+``/previsoes`` e ``/desvios`` aceitam como filtros ``safra``, ``cultivo``,
+``variavel_alvo``, ``modelo``, ``cenario`` e ``cidade``, além de ``regiao``
+(padrão ``PREVISAO_REGIAO``). As respostas ficam em um cache LRU do processo,
+com a versão do que a rota lê na chave (a dos dados e dos municípios da
+região nas previsões, a do artefato de geometria no GeoJSON e no TopoJSON),
+e levam ``ETag``: ``If-None-Match`` com a mesma etiqueta recebe 304 sem corpo.
+
+Para servir (precisa do uvicorn) com vários processos::
+
+    python api.py servir --porta 8000 --trabalhadores 4
+
+ou ``uvicorn api:app --workers 4``. Cada processo tem sua cópia dos dados e do
+cache. Para um teste de carga local contra uma API no ar::
+
+    python api.py carga http://127.0.0.1:8000/previsoes?safra=2025 --requisicoes 2000 --concorrencia 32
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import numpy as np
+
+from cache_figuras import CacheLRU
+from calculos import percentual_variacao
+from consultas import CHAVES_PREVISOES, consulta_previsoes
+from configuracao import LIMITE_CACHE_RESPOSTAS_MB, REGIAO_PADRAO
+from dados import ARQUIVO_GEOJSON, assinatura_arquivo
+from geometria import (
+    altura_graus,
+    artefato_geometria,
+    carregar_geometria,
+    carregar_topojson,
+    tolerancia_mapa,
+    tolerancia_zoom,
+)
+from nomes import padronizar_nome
+from regioes import carregar_regioes, indice_municipios, regiao
+
+COLUNAS_PREVISOES = ["cidade", "safra", "cultivo", "variavel_alvo", "modelo", "cenario", "valor", "valor_media"]
+
+FILTROS = (*CHAVES_PREVISOES, "cidade", "regiao")
+
+
+class ErroRequisicao(Exception):
+    """Parâmetro inválido; vira uma resposta 400."""
+
+
+# ``gerar(consulta, parametros)`` devolve o corpo; ``versao(consulta, parametros)``
+# identifica os dados que ele usa e vai na chave do cache
+Rota = namedtuple("Rota", ["gerar", "versao"])
+
+# Respostas (corpo, ETag), limitadas pelo tamanho dos corpos
+cache_respostas = CacheLRU(LIMITE_CACHE_RESPOSTAS_MB, tamanho=lambda resposta: len(resposta[0]))
+
+
+def _json(conteudo):
+    return json.dumps(conteudo, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _filtros(parametros):
+    desconhecidos = set(parametros) - set(FILTROS)
+    if desconhecidos:
+        raise ErroRequisicao(f"Parâmetros desconhecidos: {sorted(desconhecidos)}; use {list(FILTROS)}")
+
+    filtros = {c: parametros[c] for c in CHAVES_PREVISOES if c in parametros}
+    if "safra" in filtros:
+        try:
+            filtros["safra"] = int(filtros["safra"])
+        except ValueError:
+            raise ErroRequisicao(f"Safra inválida: {filtros['safra']!r}") from None
+    return filtros
+
+
+def _cidades(parametros):
+    try:
+        return regiao(parametros.get("regiao", REGIAO_PADRAO)).cidades
+    except KeyError as erro:
+        raise ErroRequisicao(erro.args[0]) from None
+
+
+def _linhas(consulta, parametros):
+    filtros = _filtros(parametros)
+    df = consulta.filtrar(**filtros) if filtros else consulta.df
+    if "cidade" in parametros:
+        df = df[df["cidade"] == padronizar_nome(parametros["cidade"])]
+    else:
+        df = df[df["cidade"].isin(_cidades(parametros))]
+    return df[COLUNAS_PREVISOES]
+
+
+def previsoes(consulta, parametros):
+    return _linhas(consulta, parametros).to_json(orient="records", force_ascii=False).encode("utf-8")
+
+
+def desvios(consulta, parametros):
+    df = _linhas(consulta, parametros)
+    df = df.assign(
+        percentual=percentual_variacao(df["valor"], df["valor_media"]),
+        diferenca=df["valor"] - df["valor_media"],
+    )
+    return df.to_json(orient="records", force_ascii=False).encode("utf-8")
+
+
+def opcoes(consulta, parametros):
+    return _json({
+        # tolist converte os inteiros do numpy (safra) para int
+        **{coluna: np.asarray(consulta.opcoes(coluna)).tolist() for coluna in CHAVES_PREVISOES},
+        "regioes": {r.codigo: r.nome for r in carregar_regioes().values()},
+    })
+
+
+def _geometria(parametros, padrao, carregar):
+    # ``altura`` (em pixels) escolhe a tolerância pela escala em que a região será desenhada
+    cidades = _cidades(parametros)
+    try:
+        if "tolerancia" in parametros:
+            tolerancia = float(parametros["tolerancia"])
+        elif "altura" in parametros:
+            altura = float(parametros["altura"])
+            if not math.isfinite(altura) or altura <= 0:
+                raise ValueError(f"Altura inválida: {parametros['altura']}")
+            tolerancia = tolerancia_zoom(altura_graus(cidades) / altura)
+        else:
+            tolerancia = padrao(cidades)
+        return carregar(cidades, tolerancia)
+    except ValueError as erro:
+        raise ErroRequisicao(str(erro)) from None
+
+
+def geojson(consulta, parametros):
+    return _json(_geometria(parametros, lambda cidades: None, carregar_geometria)["geojson"])
+
+
+def topojson(consulta, parametros):
+    # Sem geometria compacta no mapa, o TopoJSON sai só quantizado
+    return _json(_geometria(parametros, lambda cidades: tolerancia_mapa(cidades) or 0.0, carregar_topojson))
+
+
+def municipio(consulta, parametros):
+    try:
+        lon, lat = float(parametros["lon"]), float(parametros["lat"])
+    except (KeyError, ValueError):
+        raise ErroRequisicao("Informe lon e lat numéricos") from None
+    return _json({"lon": lon, "lat": lat, "cidade": indice_municipios().municipio(lon, lat)})
+
+
+def _versao_dados(consulta, parametros):
+    return consulta.versao, _cidades(parametros)
+
+
+def _versao_opcoes(consulta, parametros):
+    return consulta.versao, tuple(carregar_regioes())
+
+
+def _versao_geometria(consulta, parametros):
+    # A chave do artefato muda com o GeoJSON e com os municípios da região
+    return artefato_geometria(_cidades(parametros))["chave"]
+
+
+def _versao_municipios(consulta, parametros):
+    return assinatura_arquivo(ARQUIVO_GEOJSON)
+
+
+ROTAS = {
+    "/opcoes": Rota(opcoes, _versao_opcoes),
+    "/previsoes": Rota(previsoes, _versao_dados),
+    "/desvios": Rota(desvios, _versao_dados),
+    "/geojson": Rota(geojson, _versao_geometria),
+    "/topojson": Rota(topojson, _versao_geometria),
+    "/municipio": Rota(municipio, _versao_municipios),
+}
+
+
+def responder(caminho, consulta_texto):
+    """``(status, corpo, etag)`` da rota ``caminho``, do cache quando possível."""
+    rota = ROTAS.get(caminho.rstrip("/") or "/")
+    if rota is None:
+        return 404, _json({"erro": f"Rota desconhecida: {caminho}", "rotas": list(ROTAS)}), None
+
+    parametros = dict(parse_qsl(consulta_texto))
+    consulta = consulta_previsoes()
+
+    def gerar():
+        corpo = rota.gerar(consulta, parametros)
+        return corpo, '"' + hashlib.sha1(corpo).hexdigest()[:20] + '"'
+
+    try:
+        # Com a versão na chave, uma atualização invalida as respostas antigas
+        chave = (rota.versao(consulta, parametros), caminho, tuple(sorted(parametros.items())))
+        corpo, etag = cache_respostas.obter(chave, gerar)
+    except ErroRequisicao as erro:
+        return 400, _json({"erro": str(erro)}), None
+    return 200, corpo, etag
+
+
+def _cabecalho(escopo, nome):
+    for chave, valor in escopo["headers"]:
+        if chave == nome:
+            return valor.decode("latin-1")
+    return None
+
+
+async def app(escopo, receber, enviar):
+    """Aplicação ASGI."""
+    if escopo["type"] == "lifespan":
+        while True:
+            mensagem = await receber()
+            if mensagem["type"] == "lifespan.startup":
+                # Carrega os dados antes da primeira requisição
+                await asyncio.get_running_loop().run_in_executor(None, consulta_previsoes)
+                await enviar({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                await enviar({"type": "lifespan.shutdown.complete"})
+                return
+
+    if escopo["type"] != "http":
+        return
+
+    if escopo["method"] not in ("GET", "HEAD"):
+        status, corpo, etag = 405, _json({"erro": "Use GET"}), None
+    else:
+        # Filtrar e serializar são síncronos: rodam fora do laço de eventos
+        status, corpo, etag = await asyncio.get_running_loop().run_in_executor(
+            None, responder, escopo["path"], escopo["query_string"].decode("latin-1")
+        )
+
+    cabecalhos = [(b"content-type", b"application/json; charset=utf-8")]
+    if etag is not None:
+        cabecalhos.append((b"etag", etag.encode()))
+        cabecalhos.append((b"cache-control", b"no-cache"))
+        if etag in (_cabecalho(escopo, b"if-none-match") or "").split(", "):
+            status, corpo = 304, b""
+    cabecalhos.append((b"content-length", str(len(corpo)).encode()))
+
+    await enviar({"type": "http.response.start", "status": status, "headers": cabecalhos})
+    await enviar({"type": "http.response.body", "body": b"" if escopo["method"] == "HEAD" else corpo})
+
+
+def testar_carga(url, requisicoes, concorrencia, etag=False):
+    """Dispara ``requisicoes`` GETs em ``url`` com ``concorrencia`` clientes.
+
+    Com ``etag``, cada cliente reenvia a etiqueta recebida (respostas 304).
+    Devolve latências (ms) por percentil, vazão e contagem por status.
+    """
+    def cliente(quantidade):
+        tempos, status, etiqueta = [], {}, None
+        for _ in range(quantidade):
+            pedido = urllib.request.Request(url)
+            if etag and etiqueta:
+                pedido.add_header("If-None-Match", etiqueta)
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(pedido) as resposta:
+                    resposta.read()
+                    codigo, etiqueta = resposta.status, resposta.headers.get("ETag")
+            except urllib.error.HTTPError as erro:
+                codigo = erro.code
+            tempos.append(time.perf_counter() - inicio)
+            status[codigo] = status.get(codigo, 0) + 1
+        return tempos, status
+
+    cotas = [requisicoes // concorrencia + (i < requisicoes % concorrencia) for i in range(concorrencia)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as executor:
+        resultados = list(executor.map(cliente, cotas))
+    duracao = time.perf_counter() - inicio
+
+    tempos = sorted(t * 1000 for r in resultados for t in r[0])
+    status = {}
+    for _, parcial in resultados:
+        for codigo, n in parcial.items():
+            status[codigo] = status.get(codigo, 0) + n
+    percentis = statistics.quantiles(tempos, n=100) if len(tempos) > 1 else tempos * 99
+    return {
+        "requisicoes": len(tempos),
+        "concorrencia": concorrencia,
+        "vazao_rps": round(len(tempos) / duracao, 1),
+        "p50_ms": round(percentis[49], 2),
+        "p95_ms": round(percentis[94], 2),
+        "p99_ms": round(percentis[98], 2),
+        "max_ms": round(tempos[-1], 2),
+        "status": status,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    servir = comandos.add_parser("servir", help="sobe a API com o uvicorn")
+    servir.add_argument("--host", default="127.0.0.1")
+    servir.add_argument("--porta", type=int, default=8000)
+    servir.add_argument("--trabalhadores", type=int, default=1, help="processos do uvicorn")
+
+    carga = comandos.add_parser("carga", help="teste de carga contra uma API no ar")
+    carga.add_argument("url")
+    carga.add_argument("--requisicoes", type=int, default=1000)
+    carga.add_argument("--concorrencia", type=int, default=16)
+    carga.add_argument("--etag", action="store_true", help="reenvia o ETag recebido (If-None-Match)")
+
+    args = parser.parse_args()
+    if args.comando == "servir":
+        try:
+            import uvicorn
+        except ImportError:
+            parser.error("servir precisa do uvicorn (pip install uvicorn)")
+        uvicorn.run("api:app", host=args.host, port=args.porta, workers=args.trabalhadores)
+    else:
+        print(json.dumps(testar_carga(args.url, args.requisicoes, args.concorrencia, args.etag), indent=2))
+
+
+if __name__ == "__main__":
+    main()
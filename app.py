@@ -1,94 +1,62 @@
+import math
+
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import json
-import unidecode
-from shapely.geometry import shape
-from shapely.ops import unary_union
+
+from regioes import carregar_regioes
+from nomes import nomes_cidades_amigaveis, nomes_cidades_invertido, padronizar_nome
+from consultas import consulta_previsoes
+from geometria import camada_geometria
+from mapas import (
+    CENARIOS,
+    TIPOS_MAPA,
+    Selecao,
+    combinacao_indisponivel,
+    figuras_cenarios,
+    nomes_variaveis_amigaveis,
+)
+from cache_figuras import cache_figuras
+from comparacao import CONJUNTO, figura_comparacao, nome_referencia
+from series_temporais import agregados_serie, figura_serie
+from exportacao import ESCOPOS, FORMATOS, exportar, formatos_disponiveis, nome_arquivo
+from configuracao import MODO_EXIBICAO, MODO_GEOMETRIA, PAINEL_DESEMPENHO, REGIAO_PADRAO
+from pre_renderizar import carregar_pre_renderizadas
+from metricas import Metricas
+
+# Regiões Intermediárias com arquivo de municípios (ver regioes.py)
+regioes = carregar_regioes()
+
+# PREVISAO_REGIAO sem arquivo de região: abre na primeira região disponível
+regiao_padrao = REGIAO_PADRAO if REGIAO_PADRAO in regioes else next(iter(regioes))
 
 st.set_page_config(
-    page_title="Mapa de Previsão Agrícola - Região Geográfica Intermediária de Santa Maria/RS",
+    page_title=f"Mapa de Previsão Agrícola - Região Geográfica Intermediária de {regioes[regiao_padrao].nome}/RS",
     page_icon="🌾",
     layout="wide"
 )
-st.title("Mapa de Previsão Agrícola - Região Geográfica Intermediária de Santa Maria/RS")
-st.markdown("<br><br>", unsafe_allow_html=True)
-
-# Seu código para carregar os arquivos de média
-arquivos = {
-    'media_rendimento_medio_arroz_30anos.csv': ('rendimento_medio', 'arroz', '30 anos'),
-    'media_rendimento_medio_soja_20anos.csv': ('rendimento_medio', 'soja', '20 anos'),
-    'media_rendimento_medio_soja_30anos.csv': ('rendimento_medio', 'soja', '30 anos'),
-    'media_quantidade_produzida_arroz_20anos.csv': ('quantidade_produzida', 'arroz', '20 anos'),
-    'media_quantidade_produzida_arroz_30anos.csv': ('quantidade_produzida', 'arroz', '30 anos'),
-    'media_quantidade_produzida_soja_20anos.csv': ('quantidade_produzida', 'soja', '20 anos'),
-    'media_quantidade_produzida_soja_30anos.csv': ('quantidade_produzida', 'soja', '30 anos'),
-}
-
 
-nomes_variaveis_amigaveis = {
-    "rendimento_medio": "Rendimento Médio (kg/ha)",
-    "quantidade_produzida": "Quantidade Produzida (ton)",
-}
+if regiao_padrao != REGIAO_PADRAO:
+    st.error(
+        f"Região {REGIAO_PADRAO!r} (PREVISAO_REGIAO) não tem arquivo de municípios; "
+        f"mostrando {regioes[regiao_padrao].nome}. Disponíveis: {', '.join(regioes)}."
+    )
 
-def padronizar_nome(nome):
-    return unidecode.unidecode(nome.lower().strip())
+# Com mais de uma região, a escolha fica na barra lateral
+codigo_regiao = regiao_padrao
+if len(regioes) > 1:
+    codigo_regiao = st.sidebar.selectbox(
+        "Região Geográfica Intermediária:",
+        list(regioes),
+        index=list(regioes).index(regiao_padrao),
+        format_func=lambda codigo: regioes[codigo].nome,
+    )
+regiao = regioes[codigo_regiao]
 
+st.title(f"Mapa de Previsão Agrícola - Região Geográfica Intermediária de {regiao.nome}/RS")
+st.markdown("<br><br>", unsafe_allow_html=True)
 
-# Criar uma coluna para o hover com formatação em HTML:
-def formatar_diferenca(diff):
-    if pd.isna(diff):
-        return "Média indisponível"
-    bolinha = "🟢" if diff >= 0 else "🔴"
-    sinal = "+" if diff >= 0 else ""
-    return f"{bolinha} {sinal}{diff:.2f}"
-
-
-# 1. Corrige dicionário com as chaves padronizadas
-nomes_cidades_amigaveis = {
-    padronizar_nome(k): v for k, v in {
-        "Agudo": "Agudo",
-        "Cacapava do sul": "Caçapava do Sul",
-        "Cacequi": "Cacequi",
-        "Cachoeira do sul": "Cachoeira do Sul",
-        "Capao do cipo": "Capão do Cipó",
-        "Cerro branco": "Cerro Branco",
-        "Dilermano de aguiar": "Dilermando de Aguiar",
-        "Dona francisca": "Dona Francisca",
-        "Faxinal do soturno": "Faxinal do Soturno",
-        "Formigueiro": "Formigueiro",
-        "Itaara": "Itaara",
-        "Itacurubi": "Itacurubi",
-        "Ivora": "Ivorá",
-        "Jaguari": "Jaguari",
-        "Jari": "Jari",
-        "Julio de castilhos": "Júlio de Castilhos",
-        "Lavras do sul": "Lavras do Sul",
-        "Mata": "Mata",
-        "Nova esperanca do sul": "Nova Esperança do Sul",
-        "Nova palma": "Nova Palma",
-        "Novo cabrais": "Novo Cabrais",
-        "Paraiso do sul": "Paraíso do Sul",
-        "Pinhal grande": "Pinhal Grande",
-        "Quevedos": "Quevedos",
-        "Restinga seca": "Restinga Seca",
-        "Santa margarida do sul": "Santa Margarida do Sul",
-        "Santa maria": "Santa Maria",
-        "Santana da boa vista": "Santana da Boa Vista",
-        "Santiago": "Santiago",
-        "Sao francisco de assis": "São Francisco de Assis",
-        "Sao gabriel": "São Gabriel",
-        "Sao joao do polesine": "São João do Polêsine",
-        "Sao martinho da serra": "São Martinho da Serra",
-        "Sao pedro do sul": "São Pedro do Sul",
-        "Sao sepe": "São Sepé",
-        "Sao vicente do sul": "São Vicente do Sul",
-        "Silveira martins": "Silveira Martins",
-        "Toropi": "Toropi",
-        "Unistalda": "Unistalda",
-        "Vila nova do sul": "Vila Nova do Sul"
-    }.items()
-}
+# Tempos das etapas deste rerun (log e painel de desempenho)
+metricas = Metricas()
 
 descricoes_cenarios = {
     "ssp126": (
@@ -119,27 +87,15 @@ descricoes_cenarios = {
 }
 
 
-dfs = []
-
-for arquivo, (variavel_media, cultivo_media, periodo_media) in arquivos.items():
-    df_temp = pd.read_csv(arquivo)
-    
-    # Extrai a coluna que começa com "media_"
-    col_media = [col for col in df_temp.columns if col.startswith('media_')]
-    if not col_media:
-        raise ValueError(f"Nenhuma coluna começando com 'media_' encontrada em {arquivo}")
-    
-    # Cria a coluna valor padronizada
-    df_temp['valor'] = df_temp[col_media[0]]
-    
-    df_temp['variavel'] = variavel_media
-    df_temp['cultivo'] = cultivo_media
-    df_temp['periodo'] = periodo_media
-    df_temp["cidade"] = df_temp["cidade"].apply(padronizar_nome)  # importante padronizar nome da cidade
-    
-    dfs.append(df_temp)
-
-df_medias = pd.concat(dfs, ignore_index=True)
+# Previsões agrupadas pelas chaves de seleção (uma vez por versão dos dados)
+with metricas.etapa("carga"):
+    # Cada sessão continua com a versão dos dados que encontrou ao abrir; as
+    # novas pegam a mais recente (ver versoes.py)
+    if "consulta" not in st.session_state:
+        st.session_state["consulta"] = consulta_previsoes()
+    consulta = st.session_state["consulta"]
+    cidades_regiao = regiao.cidades
+    pre_renderizadas = carregar_pre_renderizadas()
 
 
 def texto_hover(valor_atual, media):
@@ -150,61 +106,25 @@ def texto_hover(valor_atual, media):
     sinal = '+' if diff >= 0 else ''
     return f"<span style='color:{cor}'>{sinal}{diff:.2f}</span>"
 
-df = pd.read_csv("dados_transformados.csv")
-df["cidade"] = df["cidade"].apply(padronizar_nome)
-
-# 2. Inverter dicionário
-nomes_cidades_invertido = {v: k for k, v in nomes_cidades_amigaveis.items()}
-
-# 3. Padronize os nomes da coluna cidade do dataframe
-df["cidade"] = df["cidade"].apply(padronizar_nome)
-
-# 4. Converte os nomes padronizados para amigáveis
-cidades_padronizadas = df["cidade"].unique()
+# Converte os nomes padronizados (das cidades da região) para amigáveis
+cidades_padronizadas = [c for c in consulta.opcoes("cidade") if c in cidades_regiao]
 cidades_amigaveis = [nomes_cidades_amigaveis.get(c, c.title()) for c in cidades_padronizadas]
 cidades_amigaveis = sorted(cidades_amigaveis)
 
-with open("geojs-43-mun.json", encoding='utf-8') as f:
-    geojson = json.load(f)
-
-for feature in geojson["features"]:
-    nome_mun = feature["properties"]["name"]
-    nome_mun_formatado = padronizar_nome(nome_mun)
-    feature["id"] = nome_mun_formatado
-
-with open("regiao-intermediaria-sm.txt", "r", encoding="utf-8") as f:
-    cidades_santa_maria = [padronizar_nome(linha) for linha in f if linha.strip()]
-
-df["regiao_santa_maria"] = df["cidade"].apply(lambda x: x in cidades_santa_maria)
-
-geojson_sm = {
-    "type": "FeatureCollection",
-    "features": [f for f in geojson["features"] if f["id"] in cidades_santa_maria]
-}
-
-# --- Borda da RGI ---
-poligonos_rgi = [shape(f["geometry"]) for f in geojson["features"] if f["id"] in cidades_santa_maria]
-borda_rgi = unary_union(poligonos_rgi)
-
-coords = []
-if borda_rgi.geom_type == 'Polygon':
-    coords = list(borda_rgi.exterior.coords)
-elif borda_rgi.geom_type == 'MultiPolygon':
-    for pol in borda_rgi.geoms:
-        coords.extend(list(pol.exterior.coords))
-
-lons, lats = zip(*coords)
-
-cidades = sorted(df["cidade"].unique())
+# GeoJSON da região e borda dissolvida vêm do artefato pré-calculado. Sem o
+# servidor de arquivos estáticos, a geometria volta a ir dentro de cada figura.
+modo_geometria = MODO_GEOMETRIA if st.get_option("server.enableStaticServing") else "embutido"
+with metricas.etapa("geometria"):
+    camada = camada_geometria(cidades_regiao, modo_geometria, nome=regiao.nome)
 
 # --- Interface ---
 col1, col2, col3, col4, col5, col6 = st.columns(6)
 
 with col1:
-    safra = st.selectbox("Safra (Ano):", sorted(df["safra"].unique()))
+    safra = st.selectbox("Safra (Ano):", consulta.opcoes("safra"))
 
 # Criar dicionário: "Soja" → "soja"
-cultivos_unicos = sorted(df["cultivo"].unique())
+cultivos_unicos = consulta.opcoes("cultivo")
 cultivos_formatados = {c.capitalize(): c for c in cultivos_unicos}
 
 with col2:
@@ -216,7 +136,7 @@ with col2:
 
 with col3:
     # Lista de variáveis disponíveis no dataframe
-    variaveis_disponiveis = sorted(df["variavel_alvo"].unique())
+    variaveis_disponiveis = consulta.opcoes("variavel_alvo")
 
     # Criar lista de labels amigáveis, mantendo apenas os que existem no DataFrame
     opcoes_variaveis = [nomes_variaveis_amigaveis[v] for v in variaveis_disponiveis]
@@ -228,315 +148,234 @@ with col3:
     variavel = {v: k for k, v in nomes_variaveis_amigaveis.items()}[variavel_label]
 
 with col4:
-    modelo = st.selectbox("Série Temporal (histórico):", sorted(df["modelo"].unique()))
+    modelo = st.selectbox("Série Temporal (histórico):", consulta.opcoes("modelo"))
 
 with col5:
     cidade_amigavel = st.selectbox("Cidade:", ["Todas"] + cidades_amigaveis)
 
+    with metricas.etapa("tabela"):
+        df_tabela = consulta.filtrar(safra=safra, cultivo=cultivo, variavel_alvo=variavel, modelo=modelo)
+
     if cidade_amigavel != "Todas":
-        cidade_selecionada = nomes_cidades_invertido.get(cidade_amigavel)
-        df_tabela = df[
-            (df["safra"] == safra) &
-            (df["cultivo"] == cultivo) &
-            (df["variavel_alvo"] == variavel) &
-            (df["modelo"] == modelo) &
-            (df["cidade"] == cidade_selecionada)
-        ]
+        # Cidades sem nome de exibição aparecem com .title(): padronizar desfaz
+        cidade_selecionada = nomes_cidades_invertido.get(cidade_amigavel, padronizar_nome(cidade_amigavel))
+        df_tabela = df_tabela[df_tabela["cidade"] == cidade_selecionada]
     else:
         cidade_selecionada = "Todas"
-      
-        df_tabela = df[
-            (df["safra"] == safra) &
-            (df["cultivo"] == cultivo) &
-            (df["variavel_alvo"] == variavel) &
-            (df["modelo"] == modelo)
-        ]
+        df_tabela = df_tabela[df_tabela["cidade"].isin(cidades_regiao)]
 
 with col6:
-    tipo_mapa = st.selectbox("Tipo de mapa:", ["Valor absoluto", "Percentual"])
-
+    tipo_mapa = st.selectbox("Tipo de mapa:", TIPOS_MAPA)
+
+
+combinacao_invalida = combinacao_indisponivel(cultivo, variavel, modelo)
+
+cenarios = CENARIOS
+
+selecao = Selecao(safra, cultivo, variavel, modelo, tipo_mapa, cidade_selecionada)
+
+# Um mapa por vez e tabela paginada sob demanda, ou a página inteira (padrão)
+sob_demanda = MODO_EXIBICAO == "sob_demanda"
+LINHAS_POR_PAGINA = 50
+
+
+def mostrar_mapa(cenario, fig, metricas):
+    """Título com a descrição do cenário e o mapa."""
+    # Pega o texto conforme o cenário (em minúsculas para garantir correspondência)
+    texto_tooltip = descricoes_cenarios.get(cenario.lower(), "Descrição não disponível para este cenário.")
+
+    st.markdown(f"""
+        <style>
+        .tooltip {{
+            position: relative;
+            display: inline-block;
+            cursor: pointer;
+            color: blue;
+            font-weight: bold;
+        }}
+
+        .tooltip .tooltiptext {{
+            visibility: hidden;
+            width: 220px;
+            background-color: #555;
+            color: #fff;
+            text-align: center;
+            border-radius: 6px;
+            padding: 5px;
+            position: absolute;
+            z-index: 1;
+            top: 125%;
+            left: 50%;
+            margin-left: -110px;
+            opacity: 0;
+            transition: opacity 0.3s;
+            font-weight: normal;
+            font-size: 12px;
+        }}
+
+        .tooltip:hover .tooltiptext {{
+            visibility: visible;
+            opacity: 1;
+        }}
+
+        .inline {{
+            display: flex;
+            align-items: center;
+            gap: 6px;
+            font-weight: bold;
+            font-size: 18px;
+        }}
+        </style>
+
+        <div class="inline">
+            <div>Cenário: {cenario.upper()}</div>
+            <span class="tooltip">ℹ️
+                <span class="tooltiptext">{texto_tooltip}</span>
+            </span>
+        </div>
+    """, unsafe_allow_html=True)
+
+    if fig is not None:
+        with metricas.etapa("plotly_chart", cenario):
+            st.plotly_chart(fig, use_container_width=True, key=f"mapa_{cenario}_{cidade_selecionada}_{safra}_{modelo}_{tipo_mapa}",config={"scrollZoom": False})
+
+        # Serializar de novo custa caro: o tamanho só é medido com o painel ligado
+        if PAINEL_DESEMPENHO:
+            metricas.contar("payload_bytes", len(fig.to_json()), cenario)
+
+
+def figuras_selecao(cenarios_exibidos, metricas):
+    # As já construídas (por qualquer sessão) vêm do cache e as geradas por
+    # pre_renderizar.py, do disco. A faixa de cores considera sempre os quatro cenários.
+    return figuras_cenarios(
+        consulta, selecao, camada, cidades_regiao, nomes_cidades_amigaveis,
+        cenarios, cache=cache_figuras, pre_renderizadas=pre_renderizadas,
+        metricas=metricas, exibir=cenarios_exibidos
+    )
 
-combinacao_invalida = (
-    cultivo == "arroz" and variavel == "rendimento_medio" and modelo == "20 anos"
-)
 
-cenarios = ["ssp126", "ssp245", "ssp370", "ssp585"] 
+@st.fragment
+def mapa_sob_demanda():
+    # Trocar de cenário reexecuta só este trecho e constrói só o mapa escolhido
+    metricas_mapa = Metricas()
+    cenario = st.radio("Cenário:", cenarios, format_func=str.upper, horizontal=True)
+    figuras = figuras_selecao([cenario], metricas_mapa)
+    mostrar_mapa(cenario, figuras[cenario], metricas_mapa)
+    metricas_mapa.registrar(selecao=selecao._asdict(), fragmento="mapa")
+
+
+@st.fragment
+def comparacao_cenarios():
+    # Diferença entre dois cenários (ou um cenário e a média deles), da tabela cidade × cenário em cache
+    if not st.toggle("Comparar cenários"):
+        return
+
+    col_cenario, col_referencia = st.columns(2)
+    with col_cenario:
+        cenario = st.selectbox("Cenário:", cenarios, index=len(cenarios) - 1, format_func=str.upper)
+    with col_referencia:
+        referencias = [CONJUNTO] + [c for c in cenarios if c != cenario]
+        referencia = st.selectbox("Comparado com:", referencias, format_func=nome_referencia)
+
+    fig = figura_comparacao(
+        consulta, selecao, cenario, referencia, camada, cidades_regiao, nomes_cidades_amigaveis,
+        cache=cache_figuras,
+    )
+    if fig is not None:
+        st.markdown(f"**{cenario.upper()} - {nome_referencia(referencia)}**")
+        st.plotly_chart(fig, use_container_width=True, key=f"comparacao_{cenario}_{referencia}", config={"scrollZoom": False})
 
 
-# Calcular zmin e zmax globais para os 4 cenários
-valores_globais = []
+@st.fragment
+def serie_temporal():
+    # Todas as safras da seleção: agregados pré-calculados por (cultivo, variável, modelo)
+    if not st.toggle("Mostrar série temporal (todas as safras)"):
+        return
 
-for cenario in cenarios:
-    df_filtrado = df[
-        (df["safra"] == safra) &
-        (df["cultivo"] == cultivo) &
-        (df["cenario"] == cenario) &
-        (df["variavel_alvo"] == variavel) &
-        (df["modelo"] == modelo)
-    ]
+    agregados = agregados_serie(consulta, cidades_regiao, cultivo, variavel, modelo)
+    fig = figura_serie(agregados, cidade_selecionada, cidade_amigavel)
+    st.plotly_chart(fig, use_container_width=True, key=f"serie_{cultivo}_{variavel}_{modelo}_{cidade_selecionada}")
 
-    if cidade_selecionada != "Todas":
-        df_filtrado = df_filtrado[df_filtrado["cidade"] == cidade_selecionada]
 
-    df_validos = df_filtrado[df_filtrado["cidade"].isin(cidades_santa_maria)]
+@st.fragment
+def tabela_dados(df_tabela):
+    # Mudar os cenários ou a página da tabela não reconstrói os mapas
 
-    if tipo_mapa == "Percentual":
-        df_medias["periodo"] = df_medias["periodo"].astype(str).str.strip()
-        df_media_cultivo_variavel = df_medias[
-            (df_medias["cultivo"] == cultivo) &
-            (df_medias["variavel"] == variavel) &
-            (df_medias["periodo"] == modelo)
-        ][["cidade", "valor"]].rename(columns={"valor": "valor_media"})
+    # Permite selecionar múltiplos cenários
+    cenarios_escolhidos = st.multiselect(
+        "Selecione um ou mais cenários",
+        ["ssp126", "ssp245", "ssp370", "ssp585"],
+        default=["ssp126", "ssp245", "ssp370", "ssp585"]  # já mostrar todos por padrão
+    )
 
-        df_validos = df_validos.merge(df_media_cultivo_variavel, on="cidade", how="left")
+    # Filtra o dataframe para os cenários escolhidos (a média histórica não entra na tabela)
+    df_tabela = df_tabela[df_tabela["cenario"].isin(cenarios_escolhidos)].drop(columns="valor_media")
 
-        # Preenche NaN da média com zero
-        df_validos["valor_media"] = df_validos["valor_media"].fillna(0)
+    # Mostra os cenários escolhidos na legenda
+    cenarios_texto = ", ".join(cenarios_escolhidos) if cenarios_escolhidos else "Nenhum cenário selecionado"
+    st.markdown(f"### Tabela de Dados Filtrados - Cenários: {cenarios_texto}")
 
-        df_validos["valor_percentual"] = df_validos.apply(
-            lambda row: ((row["valor"] - row["valor_media"]) / row["valor_media"]) * 100
-            if row["valor_media"] != 0 and row["valor"] > 0 else 0,
-            axis=1
+    # O arquivo só é gerado (ou tirado do cache) quando o botão é clicado, fora do rerun
+    col_escopo, col_formato, col_download = st.columns([2, 1, 1], vertical_alignment="bottom")
+    with col_escopo:
+        escopo = st.radio("Exportar:", list(ESCOPOS), format_func=ESCOPOS.get, horizontal=True)
+    with col_formato:
+        formato = st.selectbox("Formato:", formatos_disponiveis(), format_func=str.upper)
+    with col_download:
+        st.download_button(
+            "Baixar dados",
+            data=lambda: exportar(consulta, cidades_regiao, selecao, formato, escopo, cenarios_escolhidos),
+            file_name=nome_arquivo(selecao, formato, escopo),
+            mime=FORMATOS[formato].mime,
+            on_click="ignore",
         )
 
-        # Debug para verificar os valores
-        print(df_validos[["cidade", "valor", "valor_media", "valor_percentual"]])
-
-        valores = df_validos["valor_percentual"].tolist()
-
-    else:
-        valores = df_validos["valor"].dropna().tolist()
-
-    valores_globais.extend(valores)
-
-if valores_globais:
-    zmin_global = min(valores_globais)
-    zmax_global = max(valores_globais)
-else:
-    zmin_global, zmax_global = None, None
+    if sob_demanda:
+        if not st.toggle("Mostrar tabela"):
+            return
+
+        # Só a página visível é formatada e enviada ao navegador
+        paginas = max(1, math.ceil(len(df_tabela) / LINHAS_POR_PAGINA))
+        pagina = st.number_input("Página:", min_value=1, max_value=paginas, value=1)
+        inicio = (pagina - 1) * LINHAS_POR_PAGINA
+        df_tabela = df_tabela.iloc[inicio:inicio + LINHAS_POR_PAGINA]
+        st.caption(f"Página {pagina} de {paginas}")
+
+    # Mostra a tabela filtrada (no modo sob demanda, a página escolhida); a
+    # coluna 'valor' continua numérica e é exibida com 2 casas decimais
+    st.dataframe(
+        df_tabela.reset_index(drop=True),
+        column_config={"valor": st.column_config.NumberColumn(format="%.2f")},
+    )
 
-df_filtrado_todos = pd.DataFrame()
 
 if combinacao_invalida:
     st.warning("Essa combinação (arroz + rendimento_medio + 20 anos) não está disponível.")
 else:
-    # ao invés de cols = st.columns(4)
-
-    # Vamos fazer em duas linhas, cada uma com 2 colunas:
-    for linha in range(2):
-        cols = st.columns(2)
-        for i in range(2):
-            idx = linha * 2 + i
-            cenario = cenarios[idx]
-            
-            df_filtrado = df[
-                (df["safra"] == safra) &
-                (df["cultivo"] == cultivo) &
-                (df["cenario"] == cenario) &
-                (df["variavel_alvo"] == variavel) &
-                (df["modelo"] == modelo)
-            ]
-
-            df_medias["periodo"] = df_medias["periodo"].astype(str).str.strip()
-
-            df_filtrado = df_filtrado.merge(
-                df_medias[(df_medias["cultivo"] == cultivo) & (df_medias["variavel"] == variavel) & (df_medias["periodo"] == modelo)],
-                on="cidade", how="left", suffixes=("", "_media")
-            )
-            
-            if tipo_mapa == "Percentual":
-                # Calcula percentual de variação em relação à média histórica
-                df_filtrado["valor_percentual"] = df_filtrado.apply(
-                    lambda row: ((row["valor"] - row["valor_media"]) / row["valor_media"]) * 100
-                    if row["valor_media"] != 0 and row["valor"] > 0 else 0,
-                    axis=1
-                )
-
-                # Para o mapa valor percentual
-                df_filtrado["z_valor"] = df_filtrado["valor_percentual"]
-                df_filtrado["diferenca"] = df_filtrado["valor"] - df_filtrado["valor_media"]
-                df_filtrado["valor_formatado"] = df_filtrado["valor"].apply(lambda x: f"{x:.2f}" if pd.notna(x) else "Sem dado")
-                df_filtrado["diferenca_colorida"] = df_filtrado["valor_percentual"].apply(formatar_diferenca) + "%"
-                titulo_colorbar = "Percentual de Variação (%)"
-                nome_escala = nomes_variaveis_amigaveis.get(variavel, variavel.replace("_", " ").capitalize())
-            else:
-                # Mapa quantitativo (valor absoluto)
-                df_filtrado["z_valor"] = df_filtrado["valor"]
-                df_filtrado["diferenca"] = df_filtrado.apply(
-                    lambda row: row["valor"] - row["valor_media"] if row["valor"] > 0 else 0,
-                    axis=1
-                )
-                df_filtrado["diferenca_colorida"] = df_filtrado["diferenca"].apply(formatar_diferenca)
-                df_filtrado["valor_formatado"] = df_filtrado["valor"].apply(lambda x: f"{x:.2f}" if pd.notna(x) else "Sem dado")
-                titulo_colorbar = nomes_variaveis_amigaveis.get(variavel, variavel.replace("_", " ").capitalize())
-                nome_escala = titulo_colorbar
-
-            if cidade_selecionada != "Todas":
-                df_filtrado = df_filtrado[df_filtrado["cidade"] == cidade_selecionada]
-
-            with cols[i]:
-                # Pega o texto conforme o cenário (em minúsculas para garantir correspondência)
-                texto_tooltip = descricoes_cenarios.get(cenario.lower(), "Descrição não disponível para este cenário.")
-
-                st.markdown(f"""
-                    <style>
-                    .tooltip {{
-                        position: relative;
-                        display: inline-block;
-                        cursor: pointer;
-                        color: blue;
-                        font-weight: bold;
-                    }}
-
-                    .tooltip .tooltiptext {{
-                        visibility: hidden;
-                        width: 220px;
-                        background-color: #555;
-                        color: #fff;
-                        text-align: center;
-                        border-radius: 6px;
-                        padding: 5px;
-                        position: absolute;
-                        z-index: 1;
-                        top: 125%;
-                        left: 50%;
-                        margin-left: -110px;
-                        opacity: 0;
-                        transition: opacity 0.3s;
-                        font-weight: normal;
-                        font-size: 12px;
-                    }}
-
-                    .tooltip:hover .tooltiptext {{
-                        visibility: visible;
-                        opacity: 1;
-                    }}
-
-                    .inline {{
-                        display: flex;
-                        align-items: center;
-                        gap: 6px;
-                        font-weight: bold;
-                        font-size: 18px;
-                    }}
-                    </style>
-
-                    <div class="inline">
-                        <div>Cenário: {cenario.upper()}</div>
-                        <span class="tooltip">ℹ️
-                            <span class="tooltiptext">{texto_tooltip}</span>
-                        </span>
-                    </div>
-                """, unsafe_allow_html=True)
-
-                if not df_filtrado.empty:
-                    cidades_geojson = [f["id"] for f in geojson["features"]]
-                    df_mapa = pd.DataFrame({"cidade": cidades_geojson})
-                    df_merge = df_mapa.merge(df_filtrado[["cidade", "z_valor", "diferenca_colorida", "valor_formatado"]], on="cidade", how="left")
-                    df_merge["regiao_santa_maria"] = df_merge["cidade"].apply(lambda x: x in cidades_santa_maria)
-
-                    # Usar z_valor no mapa
-                    df_merge["z"] = df_merge.apply(
-                        lambda row: row["z_valor"] if row["regiao_santa_maria"] and pd.notna(row["z_valor"])
-                        else (-9999 if not row["regiao_santa_maria"] else None),
-                        axis=1
-                    )
-
-                    z_validos = df_merge["z"][(df_merge["z"] != -9999) & (pd.notna(df_merge["z"]))]
-                    zmin = zmin_global
-                    zmax = zmax_global
-
-                    # Adiciona nome amigável da cidade
-                    df_merge["cidade_amigavel"] = df_merge["cidade"].apply(
-                        lambda x: nomes_cidades_amigaveis.get(x, x.title())
-                    )
-
-                    # Define customdata para hover
-                    df_merge["customdata"] = list(zip(df_merge["cidade_amigavel"], df_merge["valor_formatado"], df_merge["diferenca_colorida"]))
-
-                    fig = go.Figure()
-
-                    fig.add_trace(go.Choropleth(
-                        geojson=geojson_sm,
-                        locations=df_merge["cidade"],
-                        z=df_merge["z"],
-                        featureidkey="id",
-                        colorscale=[
-                            [0.0, "#B4B4B4"],
-                            [0.2, "#d61515"],
-                            [0.4, "#fa992a"],
-                            [0.6, "#ffe605"],
-                            [0.8, "#125ED1"],
-                            [1.0, "#021835"]
-                        ],
-                        colorbar=dict(
-                            title=titulo_colorbar,
-                            thickness=10,
-                            len=0.9,
-                            x=0.90
-                        ),
-                        zmin=zmin,
-                        zmax=zmax,
-                        marker_line_color="white",
-                        marker_line_width=0.5,
-                        name=nome_escala,
-                        customdata=df_merge["customdata"],
-                        hovertemplate="<b>%{customdata[0]}</b>" + f"<br>{nome_escala}:</br>" + "%{customdata[1]}</br>" + "Desvio em relação a média histórica:<br> %{customdata[2]}</br>" + "<extra></extra>",
-                    ))
-
-                    fig.add_trace(go.Scattergeo(
-                        lon=list(lons),
-                        lat=list(lats),
-                        mode='lines',
-                        line=dict(width=1, color='white'),
-                        name='Borda Região Santa Maria',
-                        hoverinfo='skip'
-                    ))
-
-                    fig.update_geos(fitbounds="locations", visible=False)
-                    fig.update_layout(
-                        geo=dict(
-                            bgcolor="rgba(0,0,0,0)",
-                            lakecolor="rgba(0,0,0,0)",
-                            showland=True,
-                            landcolor="rgba(0,0,0,0)",
-                            showlakes=False,
-                            showrivers=False,
-                            showcoastlines=False,
-                            showcountries=False,
-                            showsubunits=False,
-                            showframe=False,
-                            fitbounds="locations"
-                        ),
-                        paper_bgcolor="rgba(0,0,0,0)",
-                        plot_bgcolor="rgba(0,0,0,0)",
-                        margin={"r":0,"t":30,"l":0,"b":0},
-                        height=400,
-                    )
-
-                    st.plotly_chart(fig, use_container_width=True, key=f"mapa_{cenario}_{cidade_selecionada}_{safra}_{modelo}_{tipo_mapa}",config={"scrollZoom": False})
+    if sob_demanda:
+        mapa_sob_demanda()
+    else:
+        figuras = figuras_selecao(cenarios, metricas)
+
+        # Vamos fazer em duas linhas, cada uma com 2 colunas:
+        for linha in range(2):
+            cols = st.columns(2)
+            for i in range(2):
+                cenario = cenarios[linha * 2 + i]
+                with cols[i]:
+                    mostrar_mapa(cenario, figuras[cenario], metricas)
 
     st.markdown("---")
 
-    # Permite selecionar múltiplos cenários
-    cenarios_escolhidos = st.multiselect(
-        "Selecione um ou mais cenários",
-        ["ssp126", "ssp245", "ssp370", "ssp585"],
-        default=["ssp126", "ssp245", "ssp370", "ssp585"]  # já mostrar todos por padrão
-    )
+    comparacao_cenarios()
 
-    # Filtra o dataframe para os cenários escolhidos
-    df_tabela = df_tabela[df_tabela["cenario"].isin(cenarios_escolhidos)].copy()
+    st.markdown("---")
 
-    # Formata a coluna 'valor' para mostrar 2 casas decimais (como string)
-    df_tabela["valor"] = df_tabela["valor"].apply(lambda x: f"{x:.2f}" if pd.notna(x) else "")
+    serie_temporal()
 
-    # Mostra os cenários escolhidos na legenda
-    cenarios_texto = ", ".join(cenarios_escolhidos) if cenarios_escolhidos else "Nenhum cenário selecionado"
-    st.markdown(f"### Tabela de Dados Filtrados - Cenários: {cenarios_texto}")
+    st.markdown("---")
 
-    # Mostra a tabela filtrada sempre
-    st.dataframe(df_tabela.reset_index(drop=True))
+    tabela_dados(df_tabela)
 
     footer = """
     <div style='
@@ -562,9 +401,15 @@ else:
     # Eliminar qualquer espaço extra abaixo do footer
     st.markdown("<style>body { margin-bottom: 0 !important; }</style>", unsafe_allow_html=True)
 
-
-
-
-
-
-
+# --- Desempenho ---
+metricas.registrar(selecao=selecao._asdict())
+
+if PAINEL_DESEMPENHO:
+    resumo = metricas.resumo()
+    with st.sidebar:
+        st.markdown("### Desempenho")
+        st.metric("Rerun", f"{resumo['total_ms']:.0f} ms")
+        st.dataframe(pd.DataFrame(resumo["etapas"]), hide_index=True)
+        st.dataframe(pd.DataFrame(resumo["contadores"]), hide_index=True)
+        st.markdown("Cache de figuras")
+        st.json(cache_figuras.estatisticas())
@@ -0,0 +1,134 @@
+"""Armazenamento colunar (Parquet/Arrow) das previsões e médias históricas.
+
+Ler os CSVs exige inferir tipos e padronizar os nomes das cidades a cada
+carga. A conversão grava em ``armazem/`` as mesmas tabelas já tipadas, com
+categorias para as colunas de texto repetitivas, nomes de cidade padronizados
+e a média histórica já unida às previsões:
+
+* ``previsoes.parquet`` e ``medias.parquet`` (comprimidos);
+* ``previsoes.arrow`` e ``medias.arrow`` (Arrow IPC sem compressão, lidos com
+  memory map quando ``PREVISAO_ARMAZEM=arrow``);
+* ``manifesto.json`` com o hash dos arquivos de origem.
+
+Se o armazém não existir, o pyarrow não estiver instalado ou algum arquivo de
+origem tiver mudado desde a conversão, ``dados`` volta a ler os CSVs.
+
+Para converter::
+
+    python armazem.py
+"""
+import json
+import logging
+import os
+
+from dados import (
+    ARQUIVO_PREVISOES,
+    ARQUIVOS_MEDIAS,
+    caminho,
+    hash_arquivo,
+)
+
+DIRETORIO_ARMAZEM = caminho("armazem")
+ARQUIVO_MANIFESTO = os.path.join("armazem", "manifesto.json")
+
+FORMATOS = ("parquet", "arrow", "csv")
+
+COLUNAS_CATEGORICAS = {
+    "previsoes": ["cidade", "cultivo", "cenario", "modelo", "variavel_alvo"],
+    "medias": ["cidade", "cultivo", "variavel", "periodo"],
+}
+
+logger = logging.getLogger(__name__)
+
+
+def arquivos_origem():
+    return [ARQUIVO_PREVISOES, *ARQUIVOS_MEDIAS]
+
+
+def _caminho_tabela(nome, formato):
+    return os.path.join(DIRETORIO_ARMAZEM, f"{nome}.{formato}")
+
+
+def _categorizar(df, nome):
+    df = df.copy()
+    for coluna in COLUNAS_CATEGORICAS[nome]:
+        df[coluna] = df[coluna].astype("category")
+    return df
+
+
+def converter():
+    """Lê os CSVs e grava o armazém colunar completo."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Importado aqui: dados importa este módulo ao carregar as tabelas
+    from dados import ler_medias_csv, ler_previsoes_csv
+
+    os.makedirs(DIRETORIO_ARMAZEM, exist_ok=True)
+
+    tabelas = {
+        "previsoes": ler_previsoes_csv(),
+        "medias": ler_medias_csv(),
+    }
+
+    for nome, df in tabelas.items():
+        tabela = pa.Table.from_pandas(_categorizar(df, nome), preserve_index=False)
+        pq.write_table(tabela, _caminho_tabela(nome, "parquet"), compression="zstd")
+
+        with pa.OSFile(_caminho_tabela(nome, "arrow"), "wb") as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+
+    # O manifesto é gravado por último: sem ele o armazém é ignorado
+    manifesto = {"origem": {arquivo: hash_arquivo(arquivo) for arquivo in arquivos_origem()}}
+    with open(caminho(ARQUIVO_MANIFESTO), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+
+
+def armazem_valido():
+    """``True`` se o armazém existe e foi gerado a partir dos arquivos atuais."""
+    if not os.path.exists(caminho(ARQUIVO_MANIFESTO)):
+        return False
+
+    with open(caminho(ARQUIVO_MANIFESTO), encoding="utf-8") as f:
+        origem = json.load(f)["origem"]
+
+    atual = {arquivo: hash_arquivo(arquivo) for arquivo in arquivos_origem()}
+    if origem != atual:
+        logger.warning("Armazém colunar desatualizado em relação aos CSVs; usando os CSVs")
+        return False
+    return True
+
+
+def ler_tabela(nome, formato):
+    """Lê ``nome`` ("previsoes" ou "medias") do armazém, ou ``None`` se indisponível."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de armazém desconhecido: {formato!r}; use um de {FORMATOS}")
+    if formato == "csv":
+        return None
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+
+    if not armazem_valido():
+        return None
+
+    arquivo = _caminho_tabela(nome, formato)
+    if formato == "arrow":
+        # Colunas numéricas sem nulos viram views do arquivo mapeado, compartilhadas
+        # entre os processos pelo cache de páginas do sistema operacional
+        tabela = pa.ipc.open_file(pa.memory_map(arquivo, "r")).read_all()
+        return tabela.to_pandas(split_blocks=True)
+
+    return pq.read_table(arquivo).to_pandas()
+
+
+if __name__ == "__main__":
+    converter()
+    for nome in COLUNAS_CATEGORICAS:
+        for formato in ("parquet", "arrow"):
+            arquivo = _caminho_tabela(nome, formato)
+            print(f"{arquivo} ({os.path.getsize(arquivo) / 1024:.0f} KiB)")
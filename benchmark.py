@@ -0,0 +1,321 @@
+"""Benchmark das etapas de um rerun do aplicativo, sem Streamlit.
+
+Mede tempo e pico de memória de cada etapa do pipeline do ``app.py``:
+
+* por escala dos dados: leitura do CSV, padronização dos nomes de cidade,
+  junção com as médias históricas e indexação da consulta;
+* por seleção: ``mapas.preparar_cenarios`` inteiro e, a partir das métricas
+  dele, as etapas internas (fatia de cada cenário, preparação das colunas do
+  mapa e faixa de cores com ``faixa_cores``), junção com os municípios do
+  mapa, construção do ``go.Figure`` e serialização para JSON.
+
+As escalas multiplicam as linhas de ``dados_transformados.csv`` com cópias
+sintéticas das cidades (nome com sufixo numérico, fora da região e com
+valores perturbados), de modo que as fatias crescem junto com a tabela.
+
+O resultado é um JSON com uma linha por (escala, etapa, seleção), que pode
+ser guardado e comparado com uma execução anterior::
+
+    python benchmark.py --escalas 1 10 100 --saida atual.json
+    python benchmark.py --escalas 1 10 100 --comparar atual.json
+
+``--comparar`` termina com código 1 se alguma etapa ficar mais lenta que a
+``--tolerancia``. Escalas grandes (1000x são ~11 milhões de linhas) exigem
+alguns GB de memória.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import plotly
+
+from configuracao import MODO_GEOMETRIA
+from consultas import CHAVES_PREVISOES, ConsultaIndexada
+from dados import (
+    ARQUIVO_PREVISOES,
+    caminho,
+    carregar_medias,
+    juntar_medias,
+)
+from geometria import MODOS_GEOMETRIA, camada_geometria
+from mapas import (
+    TIPOS_MAPA,
+    Selecao,
+    combinacao_indisponivel,
+    dados_mapa,
+    figura_mapa,
+    preparar_cenarios,
+    titulos_escala,
+)
+from metricas import Metricas
+from nomes import nomes_cidades_amigaveis, padronizar_cidades, padronizar_nome
+from regioes import regiao
+
+ESCALAS_PADRAO = (1, 10, 100)
+
+# Diferenças menores que isto são ruído de medição, não regressão
+MINIMO_REGRESSAO_S = 0.001
+
+
+def medir(funcao, repeticoes, antes=None):
+    """Executa ``funcao`` e devolve ``(resultado, medidas)``.
+
+    O tempo é medido em ``repeticoes`` execuções; o pico de memória, em uma
+    execução extra com ``tracemalloc`` ligado, para não distorcer o tempo.
+    ``antes``, se houver, roda antes de cada execução, fora da medida.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        if antes is not None:
+            antes()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    if antes is not None:
+        antes()
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return resultado, {
+        "repeticoes": repeticoes,
+        "tempo_mediano_s": statistics.median(tempos),
+        "tempo_min_s": min(tempos),
+        "pico_memoria_mb": pico / (1024 * 1024),
+    }
+
+
+def _escalar(df, escala, semente=0):
+    """``df`` com ``escala`` cópias das cidades; a cópia 0 é a original."""
+    if escala == 1:
+        return df
+
+    rng = np.random.default_rng(semente)
+    copias = []
+    for i in range(escala):
+        copia = df.copy()
+        if i:
+            copia["cidade"] = copia["cidade"].astype(str) + f" {i}"
+            copia["valor"] = copia["valor"] * rng.uniform(0.9, 1.1, len(copia))
+        copias.append(copia)
+    return pd.concat(copias, ignore_index=True)
+
+
+def dados_sinteticos(escala, diretorio):
+    """Grava o CSV de previsões em ``escala`` e devolve ``(arquivo, medias)``."""
+    previsoes = pd.read_csv(caminho(ARQUIVO_PREVISOES))
+    arquivo = os.path.join(diretorio, f"previsoes_{escala}x.csv")
+    _escalar(previsoes, escala).to_csv(arquivo, index=False)
+
+    medias = carregar_medias()
+    medias = medias.assign(**{c: medias[c].astype(str) for c in ("cidade", "cultivo", "variavel", "periodo")})
+    return arquivo, _escalar(medias, escala)
+
+
+def grade_selecoes(consulta, limite=None):
+    """Seleções da primeira safra para cada cultivo, variável, modelo e tipo de mapa."""
+    safra = consulta.opcoes("safra")[0]
+    selecoes = [
+        Selecao(safra, cultivo, variavel, modelo, tipo_mapa, "Todas")
+        for cultivo in consulta.opcoes("cultivo")
+        for variavel in consulta.opcoes("variavel_alvo")
+        for modelo in consulta.opcoes("modelo")
+        for tipo_mapa in TIPOS_MAPA
+        if not combinacao_indisponivel(cultivo, variavel, modelo)
+    ]
+    # Uma seleção de cidade única, que passa pelo filtro extra do app
+    selecoes.append(selecoes[0]._replace(cidade="santa maria"))
+    return selecoes[:limite] if limite else selecoes
+
+
+def _medir_carga(arquivo, medias, repeticoes):
+    medidas = {}
+
+    df, medidas["leitura"] = medir(lambda: pd.read_csv(arquivo), repeticoes)
+
+    # Sem limpar o cache de padronizar_nome, só a primeira execução padronizaria de fato
+    cidades, medidas["padronizacao"] = medir(
+        lambda: padronizar_cidades(df["cidade"]), repeticoes, antes=padronizar_nome.cache_clear
+    )
+    df["cidade"] = cidades
+
+    df, medidas["juntar_medias"] = medir(lambda: juntar_medias(df, medias), repeticoes)
+
+    consulta, medidas["indexacao"] = medir(lambda: ConsultaIndexada(df, CHAVES_PREVISOES), repeticoes)
+    return consulta, len(df), medidas
+
+
+def _etapas_internas(execucoes):
+    """Tempo de cada etapa registrada nas ``Metricas`` de ``execucoes``, somando os cenários."""
+    por_etapa = {}
+    for metricas in execucoes:
+        totais = {}
+        for nome, _, segundos in metricas.etapas:
+            totais[nome] = totais.get(nome, 0.0) + segundos
+        for nome, segundos in totais.items():
+            por_etapa.setdefault(nome, []).append(segundos)
+    return {
+        nome: {
+            "repeticoes": len(tempos),
+            "tempo_mediano_s": statistics.median(tempos),
+            "tempo_min_s": min(tempos),
+        }
+        for nome, tempos in por_etapa.items()
+    }
+
+
+def _medir_selecao(consulta, selecao, camada, cidades_regiao, repeticoes):
+    medidas = {}
+    execucoes = []
+
+    def preparar():
+        metricas = Metricas()
+        execucoes.append(metricas)
+        return preparar_cenarios(
+            consulta, selecao.safra, selecao.cultivo, selecao.variavel, selecao.modelo,
+            selecao.tipo_mapa, selecao.cidade, cidades_regiao, metricas=metricas,
+        )
+
+    (frames, zmin, zmax), medidas["preparar_cenarios"] = medir(preparar, repeticoes)
+    # A execução com tracemalloc (a última) fica de fora dos tempos das etapas
+    medidas.update(_etapas_internas(execucoes[:repeticoes]))
+
+    frames = {c: df for c, df in frames.items() if not df.empty}
+    merges, medidas["merge"] = medir(
+        lambda: {
+            c: dados_mapa(df, camada["locais"], cidades_regiao, nomes_cidades_amigaveis)
+            for c, df in frames.items()
+        },
+        repeticoes,
+    )
+
+    titulo_colorbar, nome_escala = titulos_escala(selecao.variavel, selecao.tipo_mapa)
+    figuras, medidas["figura"] = medir(
+        lambda: [
+            figura_mapa(df, camada, zmin, zmax, titulo_colorbar, nome_escala)
+            for df in merges.values()
+        ],
+        repeticoes,
+    )
+
+    payloads, medidas["serializacao"] = medir(lambda: [fig.to_json() for fig in figuras], repeticoes)
+    medidas["serializacao"]["bytes"] = sum(len(p) for p in payloads)
+    return medidas
+
+
+def executar(escalas, repeticoes=3, limite_selecoes=None, modo_geometria=MODO_GEOMETRIA):
+    """Roda o benchmark e devolve o documento de resultados."""
+    escolhida = regiao()
+    cidades_regiao = escolhida.cidades
+    camada = camada_geometria(cidades_regiao, modo_geometria, nome=escolhida.nome)
+    resultados = []
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        for escala in escalas:
+            arquivo, medias = dados_sinteticos(escala, diretorio)
+            consulta, linhas, medidas = _medir_carga(arquivo, medias, repeticoes)
+            os.remove(arquivo)
+
+            for etapa, valores in medidas.items():
+                resultados.append({"escala": escala, "linhas": linhas, "etapa": etapa, "selecao": None, **valores})
+
+            for selecao in grade_selecoes(consulta, limite_selecoes):
+                medidas = _medir_selecao(consulta, selecao, camada, cidades_regiao, repeticoes)
+                for etapa, valores in medidas.items():
+                    resultados.append({
+                        "escala": escala,
+                        "linhas": linhas,
+                        "etapa": etapa,
+                        "selecao": {k: str(v) for k, v in selecao._asdict().items()},
+                        **valores,
+                    })
+
+    return {
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plotly": plotly.__version__,
+            "plataforma": platform.platform(),
+            "geometria": modo_geometria,
+        },
+        "resultados": resultados,
+    }
+
+
+def _totais(documento):
+    """Tempo mediano somado por (escala, etapa)."""
+    totais = {}
+    for r in documento["resultados"]:
+        chave = (r["escala"], r["etapa"])
+        totais[chave] = totais.get(chave, 0.0) + r["tempo_mediano_s"]
+    return totais
+
+
+def comparar(anterior, atual, tolerancia):
+    """Imprime a razão atual/anterior por etapa e devolve as que regrediram."""
+    totais_anteriores = _totais(anterior)
+    regressoes = []
+
+    print(f"{'escala':>7} {'etapa':<14} {'anterior (s)':>13} {'atual (s)':>10} {'razão':>7}")
+    for chave, tempo in sorted(_totais(atual).items()):
+        if chave not in totais_anteriores:
+            continue
+        razao = tempo / totais_anteriores[chave] if totais_anteriores[chave] else float("inf")
+        regrediu = razao > tolerancia and tempo - totais_anteriores[chave] > MINIMO_REGRESSAO_S
+        marca = " <- regressão" if regrediu else ""
+        print(f"{chave[0]:>6}x {chave[1]:<14} {totais_anteriores[chave]:>13.4f} {tempo:>10.4f} {razao:>7.2f}{marca}")
+        if marca:
+            regressoes.append(chave)
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--escalas", type=int, nargs="+", default=list(ESCALAS_PADRAO),
+                        help="multiplicadores das linhas do CSV (padrão: %(default)s)")
+    parser.add_argument("--repeticoes", type=int, default=3,
+                        help="execuções cronometradas por etapa (padrão: %(default)s)")
+    parser.add_argument("--selecoes", type=int, default=None,
+                        help="limita o número de seleções da grade")
+    parser.add_argument("--geometria", choices=MODOS_GEOMETRIA, default=MODO_GEOMETRIA,
+                        help="modo da geometria das figuras (padrão: %(default)s)")
+    parser.add_argument("--saida", default="-",
+                        help="arquivo JSON de resultados; '-' para a saída padrão")
+    parser.add_argument("--comparar", metavar="ANTERIOR",
+                        help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=1.2,
+                        help="razão de tempo a partir da qual há regressão (padrão: %(default)s)")
+    args = parser.parse_args()
+
+    documento = executar(args.escalas, args.repeticoes, args.selecoes, args.geometria)
+
+    texto = json.dumps(documento, ensure_ascii=False, indent=1)
+    if args.saida == "-":
+        if not args.comparar:
+            print(texto)
+    else:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        if comparar(anterior, documento, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Cache LRU das figuras prontas, compartilhado entre as sessões.
+
+A figura de um mapa é totalmente determinada pela seleção (safra, cultivo,
+variável, modelo, cenário, cidade, tipo de mapa) e pela versão dos dados e da
+geometria. As seleções mais populares concentram a maior parte dos acessos,
+então guardar as figuras prontas evita refazer filtragem, cálculo e
+construção do ``go.Figure`` para cada usuário.
+
+``CacheLRU`` é o cache genérico, limitado pela soma dos tamanhos das
+entradas (dados por uma função); quando o total passa do limite, as entradas
+usadas há mais tempo são descartadas. Os outros caches do aplicativo
+(exportações, agregados, respostas da API...) são instâncias dele. Nas
+figuras, o tamanho de cada entrada é o do JSON. ``limpar_caches`` esvazia
+todos os caches criados no processo (ver ``dados.limpar_cache``).
+"""
+import threading
+import weakref
+from collections import OrderedDict
+
+from configuracao import LIMITE_CACHE_FIGURAS_MB
+
+_instancias = weakref.WeakSet()
+
+
+class CacheLRU:
+    """Cache LRU limitado pela soma de ``tamanho(item)`` das entradas, em MB.
+
+    ``tamanho`` devolve os bytes de um item; por padrão, ``len`` (bytes e
+    texto).
+    """
+
+    def __init__(self, limite_mb, tamanho=len):
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._tamanho = 0
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.descartes = 0
+        _instancias.add(self)
+
+    def obter(self, chave, construir):
+        """Item de ``chave``; em caso de falta, chama ``construir()`` e guarda.
+
+        ``construir`` pode devolver ``None`` (por exemplo, nada a desenhar),
+        que não é guardado.
+        """
+        with self._trava:
+            entrada = self._itens.get(chave)
+            if entrada is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return entrada[0]
+            self.faltas += 1
+
+        # Construído fora da trava para não serializar as sessões
+        item = construir()
+        if item is None:
+            return None
+
+        tamanho = self.tamanho(item)
+        if tamanho > self.limite_bytes:
+            return item
+
+        with self._trava:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._tamanho -= anterior[1]
+
+            self._itens[chave] = (item, tamanho)
+            self._tamanho += tamanho
+
+            while self._tamanho > self.limite_bytes:
+                _, (_, tamanho_descartado) = self._itens.popitem(last=False)
+                self._tamanho -= tamanho_descartado
+                self.descartes += 1
+
+        return item
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self._tamanho = 0
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                "entradas": len(self._itens),
+                "tamanho_mb": self._tamanho / (1024 * 1024),
+                "limite_mb": self.limite_bytes / (1024 * 1024),
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "descartes": self.descartes,
+            }
+
+
+def tamanho_figura(figura):
+    """Bytes do JSON de ``figura``."""
+    return len(figura.to_json())
+
+
+def limpar_caches():
+    """Esvazia todos os caches do processo (figuras, exportações, agregados...)."""
+    for cache in list(_instancias):
+        cache.limpar()
+
+
+# Instância única do processo: o módulo é importado uma vez e sobrevive aos reruns
+cache_figuras = CacheLRU(LIMITE_CACHE_FIGURAS_MB, tamanho=tamanho_figura)
@@ -0,0 +1,62 @@
+"""Colunas derivadas dos mapas, calculadas sobre arrays inteiros.
+
+Substituem os ``DataFrame.apply(..., axis=1)`` que o aplicativo usava e
+reproduzem exatamente as mesmas regras, inclusive nos casos de média zero,
+média ausente e ``valor <= 0``.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _array(serie):
+    return np.asarray(serie, dtype=float)
+
+
+def percentual_variacao(valor, valor_media):
+    """Variação percentual em relação à média histórica.
+
+    Vale 0 quando a média é zero ou o valor não é positivo; média ausente
+    (NaN) com valor positivo resulta em NaN.
+    """
+    valor, valor_media = _array(valor), _array(valor_media)
+    calcula = (valor_media != 0) & (valor > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentual = (valor - valor_media) / valor_media * 100
+
+    return np.where(calcula, percentual, 0.0)
+
+
+def diferenca_media(valor, valor_media):
+    """Diferença para a média histórica; 0 quando o valor não é positivo."""
+    valor, valor_media = _array(valor), _array(valor_media)
+    return np.where(valor > 0, valor - valor_media, 0.0)
+
+
+def formatar_valores(valores, vazio="Sem dado"):
+    """Valores com duas casas decimais; ``vazio`` onde não há dado."""
+    valores = _array(valores)
+    return np.where(np.isnan(valores), vazio, np.char.mod("%.2f", valores))
+
+
+def formatar_diferencas(diferencas):
+    """Texto do hover: bolinha verde/vermelha e diferença com sinal."""
+    diferencas = _array(diferencas)
+    positivo = diferencas >= 0
+
+    prefixo = np.where(positivo, "🟢 +", "🔴 ")
+    texto = np.char.add(prefixo, np.char.mod("%.2f", diferencas))
+    return np.where(np.isnan(diferencas), "Média indisponível", texto)
+
+
+def valores_mapa(z_valor, na_regiao):
+    """Valor do mapa: ``z_valor`` na região, -9999 fora dela e NaN sem dado."""
+    z_valor, na_regiao = _array(z_valor), np.asarray(na_regiao, dtype=bool)
+    fora = np.where(na_regiao, np.nan, -9999.0)
+    return np.where(na_regiao & ~np.isnan(z_valor), z_valor, fora)
+
+
+def nomes_amigaveis(cidades, nomes):
+    """Nome de exibição de cada cidade, com ``str.title`` como alternativa."""
+    cidades = pd.Series(cidades)
+    return cidades.map(nomes).fillna(cidades.str.title())
@@ -0,0 +1,227 @@
+"""Teste de carga do aplicativo com várias sessões simultâneas, sem navegador.
+
+Cada sessão é um ``AppTest`` do Streamlit rodando ``app.py`` numa thread
+própria, no mesmo processo, como as sessões de um servidor Streamlit: os
+caches de módulo (dados, figuras, exportações) são compartilhados entre elas.
+Cada sessão abre a página e faz uma sequência de trocas nos seletores
+(safra, cultivo, variável, modelo, cidade e tipo de mapa), sorteada com
+pesos parecidos com o uso real e semente fixa, de modo que duas execuções
+fazem as mesmas trocas.
+
+O resultado é um JSON com os percentis de latência dos reruns, a vazão
+(reruns por segundo), a memória residente por sessão e as estatísticas do
+cache de figuras. Com ``--comparar`` as latências e a vazão são comparadas
+com uma execução anterior, por exemplo antes e depois de mudar uma opção::
+
+    python carga_sessoes.py --sessoes 8 --passos 20 --saida antes.json
+    PREVISAO_TRABALHADORES_FIGURAS=4 python carga_sessoes.py --sessoes 8 --passos 20 --comparar antes.json
+
+As opções ``PREVISAO_*`` valem como no aplicativo.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dados import caminho
+
+ARQUIVO_APP = caminho("app.py")
+
+# Rótulo do seletor -> peso no sorteio da próxima troca
+PESOS_SELETORES = {
+    "Cidade:": 3,
+    "Tipo de mapa:": 2,
+    "Safra (Ano):": 2,
+    "Cultivo:": 1,
+    "Variável:": 1,
+    "Série Temporal (histórico):": 1,
+}
+
+PERCENTIS = (50, 90, 95, 99)
+
+
+def memoria_residente_mb():
+    """Memória residente do processo, em MB (``None`` fora do Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+    except OSError:
+        return None
+    return paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def sequencia_trocas(aleatorio, opcoes, passos):
+    """``passos`` trocas ``(rótulo, valor)``, cada uma diferente do valor atual do seletor."""
+    atuais = {rotulo: valores[0] for rotulo, valores in opcoes.items()}
+    rotulos = [r for r in PESOS_SELETORES if r in opcoes and len(opcoes[r]) > 1]
+    pesos = [PESOS_SELETORES[r] for r in rotulos]
+
+    trocas = []
+    for _ in range(passos):
+        rotulo = aleatorio.choices(rotulos, pesos)[0]
+        valor = aleatorio.choice([v for v in opcoes[rotulo] if v != atuais[rotulo]])
+        atuais[rotulo] = valor
+        trocas.append((rotulo, valor))
+    return trocas
+
+
+def _abrir(timeout):
+    from streamlit.testing.v1 import AppTest
+
+    sessao = AppTest.from_file(ARQUIVO_APP, default_timeout=timeout)
+    inicio = time.perf_counter()
+    sessao.run()
+    return sessao, time.perf_counter() - inicio
+
+
+def _seletores(sessao):
+    return {s.label: s for s in sessao.selectbox if s.label in PESOS_SELETORES}
+
+
+def simular_sessao(trocas, timeout):
+    """Abre uma sessão e aplica as ``trocas``; devolve as latências e os erros."""
+    sessao, abertura = _abrir(timeout)
+    latencias = []
+    erros = len(sessao.exception)
+
+    for rotulo, valor in trocas:
+        seletor = _seletores(sessao).get(rotulo)
+        if seletor is None or valor not in seletor.options:
+            continue
+        seletor.set_value(valor)
+        inicio = time.perf_counter()
+        sessao.run()
+        latencias.append(time.perf_counter() - inicio)
+        erros += len(sessao.exception)
+
+    return {"abertura_s": abertura, "latencias_s": latencias, "erros": erros}
+
+
+def _percentis(valores):
+    if not valores:
+        return {}
+    if len(valores) == 1:
+        cortes = valores * 99
+    else:
+        cortes = statistics.quantiles(valores, n=100, method="inclusive")
+    return {
+        **{f"p{p}_ms": round(cortes[p - 1] * 1000, 2) for p in PERCENTIS},
+        "max_ms": round(max(valores) * 1000, 2),
+        "media_ms": round(statistics.fmean(valores) * 1000, 2),
+    }
+
+
+def executar(sessoes, passos, semente=0, timeout=120):
+    """Roda ``sessoes`` sessões simultâneas com ``passos`` trocas cada e devolve o documento."""
+    from cache_figuras import cache_figuras
+
+    # Uma sessão de aquecimento carrega os dados e lê as opções dos seletores;
+    # a memória medida depois dela é a base, sem nenhuma sessão de carga
+    aquecimento, _ = _abrir(timeout)
+    opcoes = {rotulo: list(s.options) for rotulo, s in _seletores(aquecimento).items()}
+    del aquecimento
+    memoria_base = memoria_residente_mb()
+
+    sequencias = [
+        sequencia_trocas(random.Random(semente + i), opcoes, passos) for i in range(sessoes)
+    ]
+
+    pico = [memoria_base]
+    parar = threading.Event()
+
+    def amostrar_memoria():
+        while not parar.wait(0.05):
+            atual = memoria_residente_mb()
+            if atual is not None:
+                pico[0] = max(pico[0] or 0, atual)
+
+    amostrador = threading.Thread(target=amostrar_memoria, daemon=True)
+    amostrador.start()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(sessoes, thread_name_prefix="sessao") as executor:
+        resultados = list(executor.map(simular_sessao, sequencias, [timeout] * sessoes))
+    duracao = time.perf_counter() - inicio
+
+    parar.set()
+    amostrador.join()
+    memoria_final = memoria_residente_mb()
+
+    latencias = [t for r in resultados for t in r["latencias_s"]]
+    aberturas = [r["abertura_s"] for r in resultados]
+    reruns = len(latencias) + len(aberturas)
+    memoria = None
+    if memoria_base is not None:
+        memoria = {
+            "base_mb": round(memoria_base, 1),
+            "pico_mb": round(pico[0], 1),
+            "final_mb": round(memoria_final, 1),
+            "por_sessao_mb": round((pico[0] - memoria_base) / sessoes, 2),
+        }
+
+    return {
+        "ambiente": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "opcoes": {k: v for k, v in sorted(os.environ.items()) if k.startswith("PREVISAO_")},
+        },
+        "parametros": {"sessoes": sessoes, "passos": passos, "semente": semente},
+        "duracao_s": round(duracao, 3),
+        "reruns": reruns,
+        "vazao_reruns_s": round(reruns / duracao, 2),
+        "latencia_rerun": _percentis(latencias),
+        "latencia_abertura": _percentis(aberturas),
+        "memoria": memoria,
+        "erros": sum(r["erros"] for r in resultados),
+        "cache_figuras": cache_figuras.estatisticas(),
+    }
+
+
+def comparar(anterior, atual):
+    """Linhas de texto com a variação das latências e da vazão."""
+    linhas = []
+    for grupo in ("latencia_rerun", "latencia_abertura"):
+        for chave, valor in atual[grupo].items():
+            antes = anterior.get(grupo, {}).get(chave)
+            if antes:
+                linhas.append(f"{grupo}.{chave}: {antes:.2f} -> {valor:.2f} ({valor / antes:.2f}x)")
+    antes, depois = anterior["vazao_reruns_s"], atual["vazao_reruns_s"]
+    linhas.append(f"vazao_reruns_s: {antes:.2f} -> {depois:.2f} ({depois / antes:.2f}x)")
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessoes", type=int, default=8, help="sessões simultâneas")
+    parser.add_argument("--passos", type=int, default=20, help="trocas de seletor por sessão")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="tempo máximo de um rerun, em segundos")
+    parser.add_argument("--saida", default="-", help="arquivo JSON do resultado ('-' para a saída padrão)")
+    parser.add_argument("--comparar", metavar="ANTERIOR", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    documento = executar(args.sessoes, args.passos, args.semente, args.timeout)
+
+    texto = json.dumps(documento, ensure_ascii=False, indent=1)
+    if args.saida == "-":
+        print(texto)
+    else:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        print("\n".join(comparar(anterior, documento)), file=sys.stderr)
+
+    return 1 if documento["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Mapas de diferença entre cenários SSP.
+
+Para a seleção (safra, cultivo, variável, modelo), as previsões dos quatro
+cenários viram uma única tabela cidade × cenário, com a média dos cenários
+(``CONJUNTO``) como coluna extra. Comparar dois cenários, ou um cenário com
+a média, é então uma subtração de colunas, sem repetir o filtro e a junção
+de cada cenário. A tabela fica em cache por seleção e a figura reaproveita
+o estilo dos mapas (``mapas.dados_mapa``/``mapas.figura_mapa``) e a faixa de
+cores sobre as cidades da região.
+"""
+import numpy as np
+import pandas as pd
+
+from cache_figuras import CacheLRU
+from calculos import formatar_diferencas, formatar_valores, percentual_variacao
+from configuracao import LIMITE_CACHE_PIVOS_MB
+from mapas import CENARIOS, dados_mapa, faixa_cores, figura_mapa, nomes_variaveis_amigaveis
+
+# Coluna com a média dos cenários de cada cidade
+CONJUNTO = "conjunto"
+
+
+def nome_referencia(cenario):
+    return "Média dos cenários" if cenario == CONJUNTO else cenario.upper()
+
+
+def pivo_cenarios(consulta, safra, cultivo, variavel, modelo, cenarios=CENARIOS):
+    """Valores da seleção com uma linha por cidade e uma coluna por cenário, mais ``CONJUNTO``."""
+    df = consulta.filtrar(safra=safra, cultivo=cultivo, variavel_alvo=variavel, modelo=modelo)
+    pivo = (
+        df.pivot(index="cidade", columns="cenario", values="valor")
+        .rename(columns=str)
+        .reindex(columns=list(cenarios))
+    )
+    pivo.index = pivo.index.astype(str)
+    pivo.columns.name = None
+    pivo[CONJUNTO] = pivo[list(cenarios)].mean(axis=1)
+    return pivo
+
+
+# Tabelas cidade × cenário, limitadas pela memória delas
+cache_pivos = CacheLRU(LIMITE_CACHE_PIVOS_MB, tamanho=lambda pivo: int(pivo.memory_usage(deep=True).sum()))
+
+
+def obter_pivo(consulta, safra, cultivo, variavel, modelo):
+    """``pivo_cenarios`` do cache; recalculado só quando a partição da seleção muda."""
+    versao = consulta.versao_particao(safra=safra, cultivo=cultivo, modelo=modelo)
+    chave = (versao, safra, cultivo, variavel, modelo)
+    return cache_pivos.obter(chave, lambda: pivo_cenarios(consulta, safra, cultivo, variavel, modelo))
+
+
+def preparar_comparacao(pivo, cenario, referencia, tipo_mapa, cidade="Todas"):
+    """Linhas do mapa de ``cenario`` menos ``referencia`` (as colunas que ``dados_mapa`` usa).
+
+    No tipo "Percentual" a diferença é relativa à referência, com as regras
+    de ``calculos.percentual_variacao``.
+    """
+    if cidade != "Todas":
+        pivo = pivo[pivo.index == cidade]
+
+    valor, base = pivo[cenario].to_numpy(), pivo[referencia].to_numpy()
+    if tipo_mapa == "Percentual":
+        diferenca = percentual_variacao(valor, base)
+        texto = np.char.add(formatar_diferencas(diferenca), "%")
+    else:
+        diferenca = valor - base
+        texto = formatar_diferencas(diferenca)
+
+    return pd.DataFrame({
+        "cidade": pivo.index,
+        "z_valor": diferenca,
+        "diferenca_colorida": texto,
+        "valor_formatado": formatar_valores(valor),
+    })
+
+
+def figura_comparacao(consulta, selecao, cenario, referencia, camada, cidades_regiao, nomes_cidades, cache=None):
+    """Mapa da diferença entre ``cenario`` e ``referencia`` (um cenário ou ``CONJUNTO``).
+
+    ``None`` quando a seleção não tem dados. Com ``cache`` (um
+    ``cache_figuras.CacheLRU`` de figuras), a figura pronta é reaproveitada.
+    """
+    def construir():
+        pivo = obter_pivo(consulta, selecao.safra, selecao.cultivo, selecao.variavel, selecao.modelo)
+        df_comparacao = preparar_comparacao(pivo, cenario, referencia, selecao.tipo_mapa, selecao.cidade)
+        if df_comparacao.empty:
+            return None
+
+        na_regiao = df_comparacao[df_comparacao["cidade"].isin(cidades_regiao)]
+        zmin, zmax = faixa_cores([na_regiao["z_valor"].dropna().to_numpy(dtype=float)])
+
+        nome_variavel = nomes_variaveis_amigaveis.get(selecao.variavel, selecao.variavel)
+        titulo_colorbar = "Diferença (%)" if selecao.tipo_mapa == "Percentual" else f"Diferença - {nome_variavel}"
+        df_merge = dados_mapa(df_comparacao, camada["locais"], cidades_regiao, nomes_cidades)
+        return figura_mapa(
+            df_merge, camada, zmin, zmax, titulo_colorbar, f"{nome_variavel} ({cenario.upper()})",
+            rotulo_desvio=f"Diferença para {nome_referencia(referencia)}",
+        )
+
+    if cache is None:
+        return construir()
+    versao = consulta.versao_particao(safra=selecao.safra, cultivo=selecao.cultivo, modelo=selecao.modelo)
+    chave = (versao, camada["chave"], *selecao, "comparacao", cenario, referencia)
+    return cache.obter(chave, construir)
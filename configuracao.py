@@ -0,0 +1,48 @@
+"""Opções de execução do aplicativo, lidas de variáveis de ambiente."""
+import os
+
+# "estatico": a geometria vai para static/ e o navegador a baixa uma vez;
+# "embutido": a geometria vai dentro de cada figura (como antes)
+MODO_GEOMETRIA = os.environ.get("PREVISAO_MODO_GEOMETRIA", "estatico")
+
+# Mapas com a geometria quantizada e simplificada conforme a escala da tela;
+# "0" usa o GeoJSON original, com precisão completa
+GEOMETRIA_COMPACTA = os.environ.get("PREVISAO_GEOMETRIA_COMPACTA", "1") == "1"
+
+# Origem das tabelas: "parquet" ou "arrow" (memory map) usam o armazém colunar
+# quando ele existe e está em dia; "csv" lê sempre os CSVs
+FORMATO_ARMAZEM = os.environ.get("PREVISAO_ARMAZEM", "parquet")
+
+# Tamanho máximo, em MB de JSON, do cache de figuras compartilhado entre sessões
+LIMITE_CACHE_FIGURAS_MB = float(os.environ.get("PREVISAO_CACHE_FIGURAS_MB", "64"))
+
+# Tamanho máximo, em MB, do cache dos arquivos exportados (CSV, Parquet, Excel)
+LIMITE_CACHE_EXPORTACOES_MB = float(os.environ.get("PREVISAO_CACHE_EXPORTACOES_MB", "64"))
+
+# Tamanho máximo, em MB, do cache de respostas da API (api.py), por processo
+LIMITE_CACHE_RESPOSTAS_MB = float(os.environ.get("PREVISAO_CACHE_RESPOSTAS_MB", "64"))
+
+# Tamanho máximo, em MB, do cache dos agregados da série temporal (cada um tem poucas centenas de linhas)
+LIMITE_CACHE_AGREGADOS_MB = float(os.environ.get("PREVISAO_CACHE_AGREGADOS_MB", "16"))
+
+# Tamanho máximo, em MB, do cache das tabelas cidade × cenário da comparação de cenários
+LIMITE_CACHE_PIVOS_MB = float(os.environ.get("PREVISAO_CACHE_PIVOS_MB", "16"))
+
+# Diretório dos mapas gerados por pre_renderizar.py; servidos quando em dia com os dados
+DIRETORIO_PRE_RENDERIZADOS = os.environ.get("PREVISAO_PRE_RENDERIZADOS", "pre_renderizados")
+
+# Painel de desempenho na barra lateral (tempos por etapa, payload das figuras, cache)
+PAINEL_DESEMPENHO = os.environ.get("PREVISAO_PAINEL_DESEMPENHO", "0") == "1"
+
+# Uma linha JSON por rerun com os tempos das etapas, em stderr
+LOG_METRICAS = os.environ.get("PREVISAO_LOG_METRICAS", "1") == "1"
+
+# "completo": os quatro mapas e a tabela inteira a cada rerun; "sob_demanda": só o
+# mapa do cenário escolhido e a tabela paginada, exibida quando pedida
+MODO_EXIBICAO = os.environ.get("PREVISAO_MODO_EXIBICAO", "completo")
+
+# Threads que constroem as figuras dos cenários em paralelo; 1 constrói uma por vez
+TRABALHADORES_FIGURAS = int(os.environ.get("PREVISAO_TRABALHADORES_FIGURAS", "1"))
+
+# Região aberta por padrão: código do arquivo regiao-intermediaria-<codigo>.txt
+REGIAO_PADRAO = os.environ.get("PREVISAO_REGIAO", "sm")
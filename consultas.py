@@ -0,0 +1,167 @@
+"""Consultas indexadas sobre as previsões.
+
+Em vez de filtrar a tabela inteira com várias máscaras booleanas a cada
+rerun, os dados são agrupados uma única vez pelas chaves de seleção. Buscar a
+fatia de um cenário é então um acesso a dicionário, com custo proporcional ao
+tamanho da fatia e não ao da tabela. O índice guarda só as posições das
+linhas de cada grupo; a fatia é montada (``take``) a cada pedido, então a
+tabela continua sendo a única cópia dos dados em memória.
+
+As previsões também são divididas em partições (safra, cultivo, modelo), a
+unidade da atualização incremental (ver ``versoes``): ``substituir`` troca só
+as partições que mudaram e as demais mantêm a versão, e com ela as figuras
+já guardadas em cache.
+"""
+import copy
+import itertools
+
+import numpy as np
+import pandas as pd
+
+CHAVES_PREVISOES = ("safra", "cultivo", "variavel_alvo", "modelo", "cenario")
+CHAVES_PARTICAO = ("safra", "cultivo", "modelo")
+
+_versoes = itertools.count(1)
+
+
+def concatenar(frames, **opcoes):
+    """``pd.concat`` que mantém categóricas as colunas categóricas de ``frames[0]``.
+
+    As categorias passam a ser a união das de todos os frames (as novas no
+    fim); sem isso, juntar uma tabela do armazém com linhas lidas do CSV
+    transforma essas colunas em texto.
+    """
+    tipos = {}
+    for coluna, tipo in frames[0].dtypes.items():
+        if not isinstance(tipo, pd.CategoricalDtype):
+            continue
+        categorias = tipo.categories
+        for df in frames[1:]:
+            valores = df[coluna].dtype.categories if isinstance(df[coluna].dtype, pd.CategoricalDtype) \
+                else pd.Index(df[coluna].dropna().unique())
+            categorias = categorias.append(valores.difference(categorias))
+        tipos[coluna] = pd.CategoricalDtype(categorias, ordered=tipo.ordered)
+    return pd.concat([df.astype(tipos) for df in frames], **opcoes)
+
+
+class ConsultaIndexada:
+    """Agrupa ``df`` por ``chaves`` e devolve fatias sem varrer a tabela.
+
+    Cada fatia é uma cópia nova das linhas do grupo, que quem a recebe pode
+    modificar. ``versao`` é diferente para cada
+    consulta criada e serve para invalidar o que foi calculado a partir dela.
+    ``particao`` (um subconjunto das chaves) define as partições que
+    ``substituir`` troca e que têm versão própria.
+    """
+
+    def __init__(self, df, chaves, particao=()):
+        self.versao = next(_versoes)
+        self.df = df
+        self.chaves = tuple(chaves)
+        self.particao = tuple(particao)
+        self._posicoes_particao = [self.chaves.index(c) for c in self.particao]
+        self._vazio = df.iloc[0:0]
+        self._fatias = self._agrupar(df)
+        self._versoes_particao = {self._da_particao(chave): self.versao for chave in self._fatias}
+        self._opcoes = {}
+
+    def _agrupar(self, df, inicio=0):
+        # Chave do grupo -> posições (em ``self.df``) das linhas dele
+        grupos = df.groupby(list(self.chaves), sort=False, observed=True).indices
+        return {chave: posicoes + inicio for chave, posicoes in grupos.items()}
+
+    def _da_particao(self, chave):
+        return tuple(chave[i] for i in self._posicoes_particao)
+
+    def fatia(self, *valores):
+        """Linhas com exatamente os ``valores`` das chaves, na ordem de ``chaves``."""
+        posicoes = self._fatias.get(tuple(valores))
+        if posicoes is None:
+            return self._vazio
+        return self.df.take(posicoes)
+
+    def filtrar(self, **filtros):
+        """Linhas que atendem aos ``filtros`` (um subconjunto das chaves).
+
+        Só as chaves de grupo são percorridas; as linhas voltam na ordem
+        original da tabela.
+        """
+        desconhecidas = set(filtros) - set(self.chaves)
+        if desconhecidas:
+            raise KeyError(f"Chaves de consulta desconhecidas: {sorted(desconhecidas)}")
+
+        if len(filtros) == len(self.chaves):
+            return self.fatia(*(filtros[c] for c in self.chaves))
+
+        filtradas = [(i, filtros[c]) for i, c in enumerate(self.chaves) if c in filtros]
+        posicoes = [
+            posicoes for chave, posicoes in self._fatias.items()
+            if all(chave[i] == valor for i, valor in filtradas)
+        ]
+        if not posicoes:
+            return self._vazio
+        return self.df.take(np.sort(np.concatenate(posicoes)))
+
+    def versao_particao(self, **valores):
+        """Versão da partição com os ``valores`` das colunas de ``particao``.
+
+        Só muda quando a partição é trocada por ``substituir``.
+        """
+        return self._versoes_particao.get(tuple(valores[c] for c in self.particao), self.versao)
+
+    def particoes(self):
+        """Partição -> linhas dela, na ordem da tabela."""
+        return dict(iter(self.df.groupby(list(self.particao), sort=False, observed=True)))
+
+    def substituir(self, particoes, df_novo):
+        """Nova consulta com as linhas de ``df_novo`` no lugar das ``particoes``.
+
+        ``df_novo`` traz todas as linhas das partições substituídas (as que
+        não aparecerem nele são removidas); as colunas categóricas da tabela
+        continuam categóricas. O índice das demais partições
+        é reaproveitado, só com as posições ajustadas; esta consulta continua válida.
+        """
+        particoes = set(particoes)
+        nova = copy.copy(self)
+        nova.versao = next(_versoes)
+
+        removidas = pd.MultiIndex.from_frame(self.df[list(self.particao)]).isin(list(particoes))
+
+        # As linhas novas vão para o fim, com índice novo: a ordem dentro de
+        # cada partição é a de df_novo
+        inicio = self.df.index.max() + 1 if len(self.df) else 0
+        df_novo = df_novo.set_axis(pd.RangeIndex(inicio, inicio + len(df_novo)))
+        mantidas = self.df[~removidas]
+        nova.df = concatenar([mantidas, df_novo])
+
+        # As linhas mantidas sobem tantas posições quantas foram removidas antes delas
+        nova_posicao = np.cumsum(~removidas) - 1
+        nova._fatias = {
+            chave: nova_posicao[posicoes] for chave, posicoes in self._fatias.items()
+            if self._da_particao(chave) not in particoes
+        }
+        fatias_novas = self._agrupar(df_novo, inicio=len(mantidas))
+        nova._fatias.update(fatias_novas)
+
+        nova._versoes_particao = {
+            particao: versao for particao, versao in self._versoes_particao.items()
+            if particao not in particoes
+        }
+        nova._versoes_particao.update({self._da_particao(chave): nova.versao for chave in fatias_novas})
+        nova._opcoes = {}
+        return nova
+
+    def opcoes(self, coluna):
+        """Valores distintos de ``coluna``, ordenados."""
+        if coluna not in self._opcoes:
+            self._opcoes[coluna] = sorted(self.df[coluna].unique())
+        return self._opcoes[coluna]
+
+
+def consulta_previsoes():
+    """Consulta sobre ``dados_transformados.csv`` da versão mais recente dos dados."""
+    # Importado aqui: versoes monta as consultas com ConsultaIndexada
+    from versoes import versao_atual
+
+    return versao_atual().consulta
+
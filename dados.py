@@ -0,0 +1,200 @@
+"""Carregamento dos arquivos de dados do aplicativo.
+
+Os arquivos são lidos uma única vez por processo e o resultado é compartilhado
+entre todas as sessões. Cada entrada do cache guarda a assinatura (mtime e
+tamanho) e o hash do conteúdo dos arquivos de origem: se o mtime mudar mas o
+conteúdo for o mesmo, o valor em cache é mantido; se o conteúdo mudar, os
+dados são recarregados. Os objetos devolvidos são compartilhados e não devem
+ser modificados por quem os usa.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+from configuracao import FORMATO_ARMAZEM
+from nomes import padronizar_cidades, padronizar_nome
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+ARQUIVO_PREVISOES = "dados_transformados.csv"
+ARQUIVO_GEOJSON = "geojs-43-mun.json"
+
+# Arquivos de média histórica: (variável, cultivo, período)
+ARQUIVOS_MEDIAS = {
+    'media_rendimento_medio_arroz_30anos.csv': ('rendimento_medio', 'arroz', '30 anos'),
+    'media_rendimento_medio_soja_20anos.csv': ('rendimento_medio', 'soja', '20 anos'),
+    'media_rendimento_medio_soja_30anos.csv': ('rendimento_medio', 'soja', '30 anos'),
+    'media_quantidade_produzida_arroz_20anos.csv': ('quantidade_produzida', 'arroz', '20 anos'),
+    'media_quantidade_produzida_arroz_30anos.csv': ('quantidade_produzida', 'arroz', '30 anos'),
+    'media_quantidade_produzida_soja_20anos.csv': ('quantidade_produzida', 'soja', '20 anos'),
+    'media_quantidade_produzida_soja_30anos.csv': ('quantidade_produzida', 'soja', '30 anos'),
+}
+
+_cache = {}
+_trava = threading.RLock()
+
+
+def caminho(arquivo):
+    return os.path.join(DIRETORIO, arquivo)
+
+
+def assinatura_arquivo(arquivo):
+    info = os.stat(caminho(arquivo))
+    return (info.st_mtime_ns, info.st_size)
+
+
+def hash_arquivo(arquivo):
+    h = hashlib.sha1()
+    with open(caminho(arquivo), "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def carregar_com_cache(chave, arquivos, carregador):
+    """Devolve ``carregador()`` em cache enquanto ``arquivos`` não mudarem."""
+    assinaturas = tuple(assinatura_arquivo(a) for a in arquivos)
+
+    with _trava:
+        entrada = _cache.get(chave)
+        if entrada is not None and entrada["assinaturas"] == assinaturas:
+            return entrada["valor"]
+
+        # O mtime mudou: só recarrega se o conteúdo também mudou
+        hashes = tuple(hash_arquivo(a) for a in arquivos)
+        if entrada is not None and entrada["hashes"] == hashes:
+            entrada["assinaturas"] = assinaturas
+            return entrada["valor"]
+
+        valor = carregador()
+        _cache[chave] = {"assinaturas": assinaturas, "hashes": hashes, "valor": valor}
+        return valor
+
+
+def limpar_cache():
+    """Descarta todos os dados em cache; a próxima leitura vai ao disco.
+
+    Inclui a versão atual dos dados (``versoes``) e os caches calculados a
+    partir dela.
+    """
+    # Importado aqui: versoes depende deste módulo
+    from versoes import descartar_versao
+
+    with _trava:
+        _cache.clear()
+    descartar_versao()
+
+
+def ler_media_csv(arquivo):
+    """Lê um dos arquivos de ``ARQUIVOS_MEDIAS``."""
+    variavel_media, cultivo_media, periodo_media = ARQUIVOS_MEDIAS[arquivo]
+    df_temp = pd.read_csv(caminho(arquivo))
+
+    # Extrai a coluna que começa com "media_"
+    col_media = [col for col in df_temp.columns if col.startswith('media_')]
+    if not col_media:
+        raise ValueError(f"Nenhuma coluna começando com 'media_' encontrada em {arquivo}")
+
+    # Cria a coluna valor padronizada
+    df_temp['valor'] = df_temp[col_media[0]]
+
+    df_temp['variavel'] = variavel_media
+    df_temp['cultivo'] = cultivo_media
+    df_temp['periodo'] = periodo_media
+    df_temp["cidade"] = padronizar_cidades(df_temp["cidade"])  # importante padronizar nome da cidade
+    return df_temp
+
+
+def ler_medias_csv():
+    return pd.concat([ler_media_csv(arquivo) for arquivo in ARQUIVOS_MEDIAS], ignore_index=True)
+
+
+def juntar_medias(df, df_medias):
+    """Acrescenta a ``df`` a coluna ``valor_media`` com a média histórica da cidade."""
+    medias = df_medias[["cidade", "cultivo", "variavel", "periodo", "valor"]].rename(
+        columns={"variavel": "variavel_alvo", "periodo": "modelo", "valor": "valor_media"}
+    )
+    return df.merge(medias, on=["cidade", "cultivo", "variavel_alvo", "modelo"], how="left")
+
+
+def ler_previsoes_csv(df_medias=None):
+    """Lê ``dados_transformados.csv`` e junta as médias (``df_medias`` ou as dos CSVs)."""
+    df = pd.read_csv(caminho(ARQUIVO_PREVISOES))
+    df["cidade"] = padronizar_cidades(df["cidade"])
+    return juntar_medias(df, ler_medias_csv() if df_medias is None else df_medias)
+
+
+def _ler_tabela(nome, ler_csv):
+    from armazem import ler_tabela
+
+    df = ler_tabela(nome, FORMATO_ARMAZEM)
+    return ler_csv() if df is None else df
+
+
+def ler_previsoes():
+    """Como ``carregar_previsoes``, mas sempre lê do disco, sem passar pelo cache."""
+    return _ler_tabela("previsoes", ler_previsoes_csv)
+
+
+def ler_medias():
+    """Como ``carregar_medias``, mas sempre lê do disco, sem passar pelo cache."""
+    return _ler_tabela("medias", ler_medias_csv)
+
+
+def _arquivos_tabela(arquivos):
+    from armazem import ARQUIVO_MANIFESTO
+
+    # Com o manifesto na assinatura, uma conversão nova também invalida o cache
+    if os.path.exists(caminho(ARQUIVO_MANIFESTO)):
+        return [*arquivos, ARQUIVO_MANIFESTO]
+    return list(arquivos)
+
+
+def arquivos_previsoes():
+    """Arquivos dos quais ``carregar_previsoes`` depende."""
+    return _arquivos_tabela([ARQUIVO_PREVISOES, *ARQUIVOS_MEDIAS])
+
+
+def arquivos_medias():
+    """Arquivos dos quais ``carregar_medias`` depende."""
+    return _arquivos_tabela(ARQUIVOS_MEDIAS)
+
+
+def _ler_geojson():
+    with open(caminho(ARQUIVO_GEOJSON), encoding='utf-8') as f:
+        geojson = json.load(f)
+
+    for feature in geojson["features"]:
+        feature["id"] = padronizar_nome(feature["properties"]["name"])
+
+    return geojson
+
+
+def carregar_medias():
+    """Médias históricas de todos os arquivos ``media_*.csv`` concatenadas."""
+    return carregar_com_cache(
+        "medias",
+        arquivos_medias(),
+        ler_medias,
+    )
+
+
+def carregar_previsoes():
+    """Previsões com as cidades padronizadas e a média histórica em ``valor_media``.
+
+    Vêm do armazém colunar quando ele está em dia com os CSVs
+    (ver ``armazem``) e de ``dados_transformados.csv`` caso contrário.
+    """
+    return carregar_com_cache(
+        "previsoes",
+        arquivos_previsoes(),
+        ler_previsoes,
+    )
+
+
+def carregar_geojson():
+    """GeoJSON dos municípios do RS com ``id`` igual ao nome padronizado."""
+    return carregar_com_cache("geojson", [ARQUIVO_GEOJSON], _ler_geojson)
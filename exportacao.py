@@ -0,0 +1,165 @@
+"""Exportação dos dados filtrados em CSV, Parquet e Excel.
+
+Os arquivos são escritos em blocos de ``LINHAS_POR_BLOCO`` linhas a partir
+da tabela tipada (números continuam números; nada passa por texto antes do
+formato final), então uma exportação grande nunca existe inteira como
+``DataFrame`` de strings. Há dois escopos:
+
+* ``"selecao"``: safra, cultivo, variável, modelo e cidade escolhidos na
+  página, nos cenários marcados na tabela;
+* ``"cenarios"``: todas as safras, modelos e cenários do cultivo e da
+  variável, na cidade escolhida ou na região inteira.
+
+Os arquivos prontos ficam em um cache LRU compartilhado entre as sessões,
+com a versão dos dados na chave. No aplicativo, o arquivo só é gerado quando
+o botão de download é clicado, fora da execução do script.
+
+Parquet precisa do pyarrow e Excel do openpyxl; sem eles, o formato
+simplesmente não é oferecido.
+"""
+import importlib.util
+import io
+from collections import namedtuple
+
+from cache_figuras import CacheLRU
+from configuracao import LIMITE_CACHE_EXPORTACOES_MB
+from mapas import CENARIOS
+
+COLUNAS = ["safra", "cidade", "cultivo", "variavel_alvo", "modelo", "cenario", "valor", "valor_media"]
+
+LINHAS_POR_BLOCO = 20_000
+
+# Limite de linhas de uma planilha do Excel (o cabeçalho ocupa uma)
+LIMITE_LINHAS_EXCEL = 1_048_575
+
+Formato = namedtuple("Formato", ["extensao", "mime", "modulo"])
+
+FORMATOS = {
+    "csv": Formato("csv", "text/csv", None),
+    "parquet": Formato("parquet", "application/vnd.apache.parquet", "pyarrow"),
+    "excel": Formato("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "openpyxl"),
+}
+
+ESCOPOS = {
+    "selecao": "Seleção atual",
+    "cenarios": "Todas as safras, modelos e cenários",
+}
+
+
+def formatos_disponiveis():
+    """Formatos cujas dependências estão instaladas."""
+    return [
+        nome for nome, formato in FORMATOS.items()
+        if formato.modulo is None or importlib.util.find_spec(formato.modulo) is not None
+    ]
+
+
+def dados_exportacao(consulta, cidades_regiao, selecao, escopo="selecao", cenarios=CENARIOS):
+    """Linhas de ``escopo`` para a ``selecao``, tipadas e nas colunas de ``COLUNAS``."""
+    if escopo == "selecao":
+        df = consulta.filtrar(
+            safra=selecao.safra, cultivo=selecao.cultivo,
+            variavel_alvo=selecao.variavel, modelo=selecao.modelo,
+        )
+        df = df[df["cenario"].isin(cenarios)]
+    elif escopo == "cenarios":
+        df = consulta.filtrar(cultivo=selecao.cultivo, variavel_alvo=selecao.variavel)
+    else:
+        raise ValueError(f"Escopo desconhecido: {escopo!r}; use um de {list(ESCOPOS)}")
+
+    if selecao.cidade != "Todas":
+        df = df[df["cidade"] == selecao.cidade]
+    else:
+        df = df[df["cidade"].isin(cidades_regiao)]
+    return df[COLUNAS]
+
+
+def _blocos(df, linhas):
+    for inicio in range(0, len(df), linhas):
+        yield df.iloc[inicio:inicio + linhas]
+
+
+def _escrever_csv(df, destino, linhas):
+    destino.write(",".join(df.columns).encode("utf-8") + b"\n")
+    for bloco in _blocos(df, linhas):
+        destino.write(bloco.to_csv(index=False, header=False, lineterminator="\n").encode("utf-8"))
+
+
+def _escrever_parquet(df, destino, linhas):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Um grupo de linhas por bloco, todos com o esquema da tabela inteira
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for bloco in _blocos(df, linhas):
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+
+
+def _escrever_excel(df, destino, linhas):
+    from openpyxl import Workbook
+
+    if len(df) > LIMITE_LINHAS_EXCEL:
+        raise ValueError(f"{len(df)} linhas não cabem em uma planilha do Excel; exporte em CSV ou Parquet")
+
+    # write_only grava as linhas em sequência, sem manter a planilha em memória
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet("previsoes")
+    planilha.append(list(df.columns))
+    for bloco in _blocos(df, linhas):
+        bloco = bloco.astype(object)
+        for linha in bloco.where(bloco.notna(), None).itertuples(index=False):
+            planilha.append(linha)
+    livro.save(destino)
+
+
+_ESCRITORES = {"csv": _escrever_csv, "parquet": _escrever_parquet, "excel": _escrever_excel}
+
+
+def escrever_exportacao(df, formato, destino, linhas=LINHAS_POR_BLOCO):
+    """Grava ``df`` em ``destino`` (arquivo binário) no ``formato``, em blocos de ``linhas``."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato!r}; use um de {list(FORMATOS)}")
+    if formato not in formatos_disponiveis():
+        raise RuntimeError(f"O formato {formato!r} precisa do pacote {FORMATOS[formato].modulo}")
+    _ESCRITORES[formato](df, destino, linhas)
+
+
+# Arquivos exportados (bytes), limitados pelo tamanho total
+cache_exportacoes = CacheLRU(LIMITE_CACHE_EXPORTACOES_MB)
+
+
+def chave_exportacao(consulta, cidades_regiao, selecao, formato, escopo="selecao", cenarios=CENARIOS):
+    """Chave do arquivo no cache; muda quando as partições usadas mudam."""
+    if escopo == "selecao":
+        versao = consulta.versao_particao(safra=selecao.safra, cultivo=selecao.cultivo, modelo=selecao.modelo)
+        filtros = (selecao.safra, selecao.modelo, tuple(cenarios))
+    else:
+        versao = consulta.versao
+        filtros = ()
+    return (
+        versao, frozenset(cidades_regiao), formato, escopo,
+        selecao.cultivo, selecao.variavel, selecao.cidade, *filtros,
+    )
+
+
+def exportar(consulta, cidades_regiao, selecao, formato, escopo="selecao", cenarios=CENARIOS):
+    """Conteúdo do arquivo exportado, do cache quando já foi gerado."""
+    def gerar():
+        destino = io.BytesIO()
+        escrever_exportacao(dados_exportacao(consulta, cidades_regiao, selecao, escopo, cenarios), formato, destino)
+        return destino.getvalue()
+
+    chave = chave_exportacao(consulta, cidades_regiao, selecao, formato, escopo, cenarios)
+    return cache_exportacoes.obter(chave, gerar)
+
+
+def nome_arquivo(selecao, formato, escopo="selecao"):
+    """Nome sugerido para o download."""
+    partes = [selecao.cultivo, selecao.variavel]
+    if escopo == "selecao":
+        partes += [str(selecao.safra), selecao.modelo]
+    if selecao.cidade != "Todas":
+        partes.append(selecao.cidade)
+    nome = "_".join(partes).replace(" ", "_")
+    return f"previsoes_{nome}.{FORMATOS[formato].extensao}"
@@ -0,0 +1,457 @@
+"""Artefato de geometria da Região Intermediária.
+
+O GeoJSON completo do RS tem 496 municípios, mas o mapa só usa os da região.
+Este módulo gera (uma vez) em ``cache/`` os arquivos da região:
+
+* ``regiao_<chave>.json``: a chave, as cidades e os ``limites`` da região;
+* ``regiao_<chave>_geojson_original.json``: o GeoJSON filtrado da região
+  (``geojson``) e a borda dissolvida (``borda``, e suas coordenadas em
+  ``lons``/``lats``);
+* ``regiao_<chave>_geojson_<tolerancia>.json``: o mesmo, simplificado
+  preservando a topologia, para cada tolerância de ``TOLERANCIAS`` (em graus;
+  0 só quantiza), com as coordenadas arredondadas para ``CASAS_DECIMAIS``
+  casas;
+* ``regiao_<chave>_topojson_<tolerancia>.json``: a geometria simplificada em
+  TopoJSON quantizado, em que cada divisa entre dois municípios é um arco só.
+
+Cada arquivo só é lido quando alguém pede aquela versão: o aplicativo lê a
+do mapa e a API, as que forem requisitadas.
+
+O GeoJSON original tem dez casas decimais (precisão de milímetros) e repete
+cada divisa nos dois municípios. O mapa usa a versão simplificada escolhida
+por ``tolerancia_mapa``: a maior tolerância que fica abaixo de meio pixel na
+altura do mapa, de modo que a simplificação não aparece na tela. Com
+``PREVISAO_GEOMETRIA_COMPACTA=0`` o mapa volta a usar o GeoJSON original. O
+Plotly só lê GeoJSON; o TopoJSON é servido pela API (``api.py``) para
+clientes que o leem.
+
+O nome do arquivo é derivado da lista de cidades e do hash do GeoJSON de
+origem, então qualquer mudança em um dos dois gera um artefato novo. Quando o
+artefato já existe, o aplicativo nem abre o GeoJSON completo nem importa o
+Shapely.
+
+Há um artefato por região (ver ``regioes``). Para gerar os de todas as
+regiões antes de subir o aplicativo::
+
+    python geometria.py
+"""
+import hashlib
+import json
+import logging
+import os
+
+from dados import (
+    ARQUIVO_GEOJSON,
+    caminho,
+    carregar_com_cache,
+    carregar_geojson,
+    hash_arquivo,
+)
+from configuracao import GEOMETRIA_COMPACTA
+from nomes import nomes_sem_geometria
+from regioes import carregar_regioes
+
+DIRETORIO_CACHE = caminho("cache")
+
+TOLERANCIAS = (0.0, 0.002, 0.005, 0.01)
+
+# 4 casas decimais são ~11 m, bem menos que um pixel mesmo com um município na tela
+CASAS_DECIMAIS = 4
+
+# Altura dos mapas (mapas.figura_mapa), que define quantos graus cabem num pixel
+ALTURA_MAPA_PX = 400
+
+DIRETORIO_ESTATICO = caminho("static")
+
+# Id da feature extra com a borda dissolvida nos arquivos de ``static/``
+ID_BORDA = "__borda_rgi__"
+
+MODOS_GEOMETRIA = ("estatico", "embutido")
+
+logger = logging.getLogger(__name__)
+
+# Incrementar quando o formato do artefato mudar
+VERSAO_ARTEFATO = 4
+
+
+def chave_artefato(cidades):
+    h = hashlib.sha1()
+    h.update(f"v{VERSAO_ARTEFATO}".encode())
+    h.update(hash_arquivo(ARQUIVO_GEOJSON).encode())
+    h.update("\n".join(sorted(cidades)).encode("utf-8"))
+    h.update(repr((TOLERANCIAS, CASAS_DECIMAIS)).encode())
+    return h.hexdigest()[:16]
+
+
+def caminho_artefato(cidades):
+    return os.path.join(DIRETORIO_CACHE, f"regiao_{chave_artefato(cidades)}.json")
+
+
+def _caminho_versao(chave, formato, tolerancia):
+    rotulo = "original" if tolerancia is None else float(tolerancia)
+    return os.path.join(DIRETORIO_CACHE, f"regiao_{chave}_{formato}_{rotulo}.json")
+
+
+def _coordenadas_borda(borda):
+    coords = []
+    if borda.geom_type == 'Polygon':
+        coords = list(borda.exterior.coords)
+    elif borda.geom_type == 'MultiPolygon':
+        for pol in borda.geoms:
+            coords.extend(list(pol.exterior.coords))
+
+    lons, lats = zip(*coords)
+    return list(lons), list(lats)
+
+
+def _simplificar(poligonos, tolerancia):
+    import shapely
+
+    if not tolerancia:
+        return list(poligonos)
+
+    # A simplificação de cobertura mantém as divisas entre municípios
+    # idênticas; versões antigas do Shapely só simplificam polígono a polígono
+    if hasattr(shapely, "coverage_simplify"):
+        return list(shapely.coverage_simplify(poligonos, tolerancia))
+    return [p.simplify(tolerancia, preserve_topology=True) for p in poligonos]
+
+
+def _borda(poligonos, quantizar=False):
+    from shapely.geometry import mapping
+    from shapely.ops import unary_union
+
+    # A união é feita antes de arredondar, quando os polígonos ainda são válidos
+    borda = unary_union(poligonos)
+    if quantizar:
+        borda = _quantizar(borda)
+    lons, lats = _coordenadas_borda(borda)
+    return {"borda": mapping(borda), "lons": lons, "lats": lats}
+
+
+def _quantizar(geometria):
+    import numpy as np
+    import shapely
+
+    return shapely.transform(geometria, lambda coords: np.round(coords, CASAS_DECIMAIS))
+
+
+def _aneis(poligono):
+    """Anéis de cada parte do polígono como tuplas de inteiros na grade, sem repetições seguidas."""
+    passo = 10 ** CASAS_DECIMAIS
+    partes = poligono.geoms if poligono.geom_type == "MultiPolygon" else [poligono]
+    aneis_partes = []
+    for parte in partes:
+        aneis = []
+        for anel in [parte.exterior, *parte.interiors]:
+            pontos = []
+            for x, y in anel.coords[:-1]:
+                ponto = (round(x * passo), round(y * passo))
+                if not pontos or pontos[-1] != ponto:
+                    pontos.append(ponto)
+            while len(pontos) > 1 and pontos[0] == pontos[-1]:
+                pontos.pop()
+            if len(pontos) >= 3:
+                aneis.append(pontos)
+        if aneis:
+            aneis_partes.append(aneis)
+    return aneis_partes
+
+
+def _juncoes(todos_aneis):
+    # Junção: ponto visto com vizinhos diferentes em dois lugares (onde
+    # uma divisa começa ou termina). Numa divisa comum, os dois anéis passam
+    # pelo ponto com os mesmos vizinhos, em sentidos opostos.
+    vizinhos = {}
+    juncoes = set()
+    for pontos in todos_aneis:
+        n = len(pontos)
+        for i, ponto in enumerate(pontos):
+            par = frozenset((pontos[i - 1], pontos[(i + 1) % n]))
+            anterior = vizinhos.setdefault(ponto, par)
+            if anterior != par:
+                juncoes.add(ponto)
+    return juncoes
+
+
+def _cortar(pontos, juncoes):
+    """Arcos do anel fechado ``pontos``, cortado nas ``juncoes``."""
+    posicoes = [i for i, p in enumerate(pontos) if p in juncoes]
+    if not posicoes:
+        # Anel sem junção (ilha ou enclave): um arco só, começando no menor ponto
+        inicio = pontos.index(min(pontos))
+        girado = pontos[inicio:] + pontos[:inicio]
+        return [girado + [girado[0]]]
+
+    girado = pontos[posicoes[0]:] + pontos[:posicoes[0]]
+    cortes = [i - posicoes[0] for i in posicoes] + [len(pontos)]
+    girado.append(girado[0])
+    return [girado[a:b + 1] for a, b in zip(cortes, cortes[1:])]
+
+
+def _topojson(ids, poligonos):
+    """TopoJSON quantizado dos ``poligonos`` (objeto ``municipios``), com os arcos compartilhados.
+
+    As coordenadas são inteiros numa grade de ``10**-CASAS_DECIMAIS`` graus,
+    então a versão decodificada coincide com o GeoJSON arredondado.
+    """
+    aneis = [_aneis(p) for p in poligonos]
+    juncoes = _juncoes([anel for partes in aneis for parte in partes for anel in parte])
+
+    indices = {}
+    arcos = []
+
+    def indice(arco):
+        chave = tuple(arco)
+        if chave in indices:
+            return indices[chave]
+        reverso = chave[::-1]
+        if reverso in indices:
+            return ~indices[reverso]
+        indices[chave] = len(arcos)
+        arcos.append(arco)
+        return indices[chave]
+
+    geometrias = []
+    for id_, partes in zip(ids, aneis):
+        partes_arcos = [[[indice(a) for a in _cortar(anel, juncoes)] for anel in parte] for parte in partes]
+        if len(partes_arcos) == 1:
+            geometrias.append({"type": "Polygon", "id": id_, "arcs": partes_arcos[0]})
+        else:
+            geometrias.append({"type": "MultiPolygon", "id": id_, "arcs": partes_arcos})
+
+    pontos = [p for arco in arcos for p in arco]
+    x0 = min((x for x, _ in pontos), default=0)
+    y0 = min((y for _, y in pontos), default=0)
+
+    # Cada arco guarda o primeiro ponto relativo à origem e depois só as diferenças
+    arcos_delta = []
+    for arco in arcos:
+        anterior = (x0, y0)
+        delta = []
+        for x, y in arco:
+            delta.append([x - anterior[0], y - anterior[1]])
+            anterior = (x, y)
+        arcos_delta.append(delta)
+
+    passo = 10 ** -CASAS_DECIMAIS
+    return {
+        "type": "Topology",
+        "transform": {"scale": [passo, passo], "translate": [x0 * passo, y0 * passo]},
+        "objects": {"municipios": {"type": "GeometryCollection", "geometries": geometrias}},
+        "arcs": arcos_delta,
+    }
+
+
+def _geojson_simplificado(features, poligonos):
+    from shapely.geometry import mapping
+
+    quantizados = [_quantizar(p) for p in poligonos]
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": f["id"],
+                "properties": f["properties"],
+                "geometry": mapping(p),
+            }
+            for f, p in zip(features, quantizados)
+        ],
+    }
+    return {"geojson": geojson, **_borda(poligonos, quantizar=True)}
+
+
+def construir_artefato(cidades):
+    """Conteúdo de cada arquivo do artefato das ``cidades``: caminho -> JSON."""
+    from shapely.geometry import shape
+
+    conjunto = set(cidades)
+    features = [f for f in carregar_geojson()["features"] if f["id"] in conjunto]
+
+    faltando = nomes_sem_geometria(conjunto, [f["id"] for f in features])
+    if faltando:
+        logger.warning("Cidades sem feature no GeoJSON (ficam fora do mapa): %s", ", ".join(faltando))
+    poligonos = [shape(f["geometry"]) for f in features]
+    chave = chave_artefato(cidades)
+
+    # A versão original mantém as features do GeoJSON, sem reescrever as coordenadas
+    original = {"geojson": {"type": "FeatureCollection", "features": features}, **_borda(poligonos)}
+    arquivos = {_caminho_versao(chave, "geojson", None): original}
+    for tol in TOLERANCIAS:
+        simplificados = _simplificar(poligonos, tol)
+        arquivos[_caminho_versao(chave, "geojson", tol)] = _geojson_simplificado(features, simplificados)
+        arquivos[_caminho_versao(chave, "topojson", tol)] = _topojson([f["id"] for f in features], simplificados)
+
+    lons, lats = original["lons"], original["lats"]
+    arquivos[caminho_artefato(cidades)] = {
+        "chave": chave,
+        "cidades": sorted(conjunto),
+        "limites": [min(lons), min(lats), max(lons), max(lats)],
+    }
+    return arquivos
+
+
+def _gravar_json(destino, conteudo):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(conteudo, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporario, destino)
+
+
+def gerar_artefato(cidades):
+    """Constrói os arquivos do artefato e grava em ``cache/`` de forma atômica.
+
+    Devolve os caminhos gravados.
+    """
+    arquivos = construir_artefato(cidades)
+    base = caminho_artefato(cidades)
+    # O arquivo base é gravado por último: se ele existe, os outros também
+    for destino, conteudo in arquivos.items():
+        if destino != base:
+            _gravar_json(destino, conteudo)
+    _gravar_json(base, arquivos[base])
+    return list(arquivos)
+
+
+def _ler_arquivo(cidades, destino):
+    if not os.path.exists(destino):
+        gerar_artefato(cidades)
+
+    with open(destino, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def artefato_geometria(cidades):
+    """``chave``, ``cidades`` e ``limites`` (lon/lat mínimas e máximas) do artefato."""
+    return carregar_com_cache(
+        ("geometria", tuple(sorted(cidades))),
+        [ARQUIVO_GEOJSON],
+        lambda: _ler_arquivo(cidades, caminho_artefato(cidades)),
+    )
+
+
+def _carregar_versao(cidades, formato, tolerancia):
+    if tolerancia is not None:
+        if float(tolerancia) not in TOLERANCIAS:
+            raise ValueError(f"Tolerância {tolerancia} indisponível; use uma de {TOLERANCIAS}")
+        tolerancia = float(tolerancia)
+
+    destino = _caminho_versao(artefato_geometria(cidades)["chave"], formato, tolerancia)
+    return carregar_com_cache(
+        ("geometria", tuple(sorted(cidades)), formato, tolerancia),
+        [ARQUIVO_GEOJSON],
+        lambda: _ler_arquivo(cidades, destino),
+    )
+
+
+def carregar_geometria(cidades, tolerancia=None):
+    """Geometria da região para as ``cidades`` informadas.
+
+    Devolve um dicionário com ``geojson``, ``borda``, ``lons`` e ``lats``. Com
+    ``tolerancia=None`` a geometria é a original; caso contrário, deve ser
+    um dos valores de ``TOLERANCIAS``.
+    """
+    return _carregar_versao(cidades, "geojson", tolerancia)
+
+
+def carregar_topojson(cidades, tolerancia):
+    """TopoJSON da região na ``tolerancia`` (um dos valores de ``TOLERANCIAS``)."""
+    if tolerancia is None:
+        raise ValueError(f"O TopoJSON só existe simplificado; use uma tolerância de {TOLERANCIAS}")
+    return _carregar_versao(cidades, "topojson", tolerancia)
+
+
+def altura_graus(cidades):
+    """Extensão da região em latitude, em graus."""
+    _, sul, _, norte = artefato_geometria(cidades)["limites"]
+    return norte - sul
+
+
+def tolerancia_zoom(graus_por_pixel):
+    """Maior tolerância de ``TOLERANCIAS`` que não passa de meio pixel."""
+    return max((t for t in TOLERANCIAS if t <= graus_por_pixel / 2), default=0.0)
+
+
+def tolerancia_mapa(cidades, altura_px=ALTURA_MAPA_PX):
+    """Tolerância da geometria do mapa das ``cidades`` (``None``: GeoJSON original).
+
+    O mapa enquadra a região (``fitbounds``), então um pixel vale pelo menos
+    a extensão em latitude dividida pela altura do mapa.
+    """
+    if not GEOMETRIA_COMPACTA:
+        return None
+    return tolerancia_zoom(altura_graus(cidades) / altura_px)
+
+
+def publicar_geometria(cidades, tolerancia=None):
+    """Grava a geometria em ``static/`` e devolve a URL relativa do arquivo.
+
+    O arquivo traz só ``id`` e geometria de cada município, mais a borda
+    dissolvida como a feature ``ID_BORDA``. O nome inclui a chave do
+    artefato, então o navegador pode mantê-lo em cache: os quatro mapas o
+    baixam uma única vez e os reruns seguintes só trazem os valores.
+    """
+    artefato = artefato_geometria(cidades)
+    versao = carregar_geometria(cidades, tolerancia)
+
+    sufixo = "" if tolerancia is None else f"_{tolerancia}"
+    nome = f"regiao_{artefato['chave']}{sufixo}.json"
+    destino = os.path.join(DIRETORIO_ESTATICO, nome)
+
+    if not os.path.exists(destino):
+        features = [
+            {"type": "Feature", "id": f["id"], "geometry": f["geometry"]}
+            for f in versao["geojson"]["features"]
+        ]
+        features.append({"type": "Feature", "id": ID_BORDA, "geometry": versao["borda"]})
+        _gravar_json(destino, {"type": "FeatureCollection", "features": features})
+
+    return f"app/static/{nome}"
+
+
+def camada_geometria(cidades, modo="estatico", tolerancia="mapa", nome=None):
+    """Geometria no formato que ``mapas.construir_figura`` consome.
+
+    No modo ``"estatico"`` o GeoJSON vai como URL de ``static/`` e a borda é
+    a feature ``ID_BORDA`` do mesmo arquivo; no modo ``"embutido"`` o GeoJSON
+    e as coordenadas da borda vão dentro de cada figura. ``chave``
+    identifica a geometria usada. ``tolerancia="mapa"`` usa a de
+    ``tolerancia_mapa``; ``None`` usa o GeoJSON original. ``nome`` é o nome
+    da região, usado no rótulo da borda.
+    """
+    if modo not in MODOS_GEOMETRIA:
+        raise ValueError(f"Modo de geometria desconhecido: {modo!r}; use um de {MODOS_GEOMETRIA}")
+    if tolerancia == "mapa":
+        tolerancia = tolerancia_mapa(cidades)
+
+    versao = carregar_geometria(cidades, tolerancia)
+    locais = [f["id"] for f in versao["geojson"]["features"]]
+    chave = f"{modo}:{artefato_geometria(cidades)['chave']}:{tolerancia}"
+
+    if modo == "estatico":
+        return {
+            "chave": chave,
+            "nome": nome,
+            "geojson": publicar_geometria(cidades, tolerancia),
+            "locais": locais,
+            "borda_id": ID_BORDA,
+        }
+
+    return {
+        "chave": chave,
+        "nome": nome,
+        "geojson": versao["geojson"],
+        "locais": locais,
+        "lons": versao["lons"],
+        "lats": versao["lats"],
+    }
+
+
+if __name__ == "__main__":
+    for regiao in carregar_regioes().values():
+        for destino in gerar_artefato(regiao.cidades):
+            print(f"{regiao.nome}: {destino} ({os.path.getsize(destino) / 1024:.0f} KiB)")
+        print(publicar_geometria(regiao.cidades))
@@ -0,0 +1,319 @@
+"""Preparação dos dados e construção das figuras dos mapas de cenário.
+
+Uma única passada monta, para cada cenário SSP, a fatia da seleção (que já traz
+a média histórica) com as colunas que o mapa usa, e calcula a faixa de cores
+(zmin/zmax) comum aos quatro mapas. ``construir_figura`` transforma uma dessas
+fatias no ``go.Figure`` do mapa e ``figuras_cenarios`` junta as duas etapas,
+consultando o cache de figuras quando ele é informado.
+"""
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from calculos import (
+    diferenca_media,
+    formatar_diferencas,
+    formatar_valores,
+    nomes_amigaveis,
+    percentual_variacao,
+    valores_mapa,
+)
+from configuracao import TRABALHADORES_FIGURAS
+from metricas import SEM_METRICAS
+
+CENARIOS = ["ssp126", "ssp245", "ssp370", "ssp585"]
+
+nomes_variaveis_amigaveis = {
+    "rendimento_medio": "Rendimento Médio (kg/ha)",
+    "quantidade_produzida": "Quantidade Produzida (ton)",
+}
+
+# Tudo o que o usuário escolhe na interface e que determina os mapas
+Selecao = namedtuple("Selecao", ["safra", "cultivo", "variavel", "modelo", "tipo_mapa", "cidade"])
+
+TIPOS_MAPA = ["Valor absoluto", "Percentual"]
+
+ESCALA_CORES = [
+    [0.0, "#B4B4B4"],
+    [0.2, "#d61515"],
+    [0.4, "#fa992a"],
+    [0.6, "#ffe605"],
+    [0.8, "#125ED1"],
+    [1.0, "#021835"]
+]
+
+TRANSPARENTE = "rgba(0,0,0,0)"
+
+# Pool compartilhado pelas sessões, criado no primeiro uso
+_executor = None
+_trava_executor = threading.Lock()
+
+
+def _preparar_cenario(df_cenario, tipo_mapa):
+    # A média histórica já vem unida às previsões (coluna valor_media)
+    df_filtrado = df_cenario.reset_index(drop=True)
+
+    if tipo_mapa == "Percentual":
+        # Calcula percentual de variação em relação à média histórica
+        df_filtrado["valor_percentual"] = percentual_variacao(df_filtrado["valor"], df_filtrado["valor_media"])
+
+        # Para o mapa valor percentual
+        df_filtrado["z_valor"] = df_filtrado["valor_percentual"]
+        df_filtrado["diferenca"] = df_filtrado["valor"] - df_filtrado["valor_media"]
+        df_filtrado["valor_formatado"] = formatar_valores(df_filtrado["valor"])
+        df_filtrado["diferenca_colorida"] = pd.Series(formatar_diferencas(df_filtrado["valor_percentual"]), index=df_filtrado.index) + "%"
+    else:
+        # Mapa quantitativo (valor absoluto)
+        df_filtrado["z_valor"] = df_filtrado["valor"]
+        df_filtrado["diferenca"] = diferenca_media(df_filtrado["valor"], df_filtrado["valor_media"])
+        df_filtrado["diferenca_colorida"] = formatar_diferencas(df_filtrado["diferenca"])
+        df_filtrado["valor_formatado"] = formatar_valores(df_filtrado["valor"])
+
+    return df_filtrado
+
+
+def _valores_faixa(df_filtrado, cidades_regiao, tipo_mapa):
+    df_validos = df_filtrado[df_filtrado["cidade"].isin(cidades_regiao)]
+
+    if tipo_mapa == "Percentual":
+        # Para a faixa de cores, média ausente conta como zero
+        valor_media = df_validos["valor_media"].fillna(0)
+        return percentual_variacao(df_validos["valor"], valor_media)
+
+    return df_validos["valor"].dropna().to_numpy(dtype=float)
+
+
+def preparar_cenarios(consulta, safra, cultivo, variavel, modelo,
+                      tipo_mapa, cidade, cidades_regiao, cenarios=CENARIOS, metricas=SEM_METRICAS):
+    """Monta os dados de todos os ``cenarios`` da seleção em uma passada.
+
+    Devolve ``(frames, zmin, zmax)``: ``frames`` mapeia cada cenário para o
+    seu DataFrame (com a média histórica e filtrado pela ``cidade``,
+    quando não for "Todas"); ``zmin``/``zmax`` formam a faixa de cores
+    comum, ou ``None`` se não houver valores. Os tempos de cada etapa vão
+    para ``metricas``.
+    """
+    frames = {}
+    valores_globais = []
+
+    for cenario in cenarios:
+        with metricas.etapa("filtro", cenario):
+            df_cenario = consulta.fatia(safra, cultivo, variavel, modelo, cenario)
+
+            if cidade != "Todas":
+                df_cenario = df_cenario[df_cenario["cidade"] == cidade]
+
+        with metricas.etapa("preparacao", cenario):
+            df_filtrado = _preparar_cenario(df_cenario, tipo_mapa)
+        frames[cenario] = df_filtrado
+
+        with metricas.etapa("faixa", cenario):
+            valores_globais.append(_valores_faixa(df_filtrado, cidades_regiao, tipo_mapa))
+
+    with metricas.etapa("faixa"):
+        zmin, zmax = faixa_cores(valores_globais)
+    return frames, zmin, zmax
+
+
+def faixa_cores(valores):
+    """``(zmin, zmax)`` comum a todos os arrays de ``valores``, ou ``(None, None)`` sem valores."""
+    valores = np.concatenate(valores) if len(valores) else np.empty(0)
+    if valores.size:
+        return float(valores.min()), float(valores.max())
+    return None, None
+
+
+def dados_mapa(df_filtrado, locais, cidades_regiao, nomes_cidades):
+    """Uma linha por município de ``locais`` com ``z`` e o ``customdata`` do hover."""
+    df_mapa = pd.DataFrame({"cidade": locais})
+    df_merge = df_mapa.merge(df_filtrado[["cidade", "z_valor", "diferenca_colorida", "valor_formatado"]], on="cidade", how="left")
+    df_merge["na_regiao"] = df_merge["cidade"].isin(cidades_regiao)
+
+    # Usar z_valor no mapa
+    df_merge["z"] = valores_mapa(df_merge["z_valor"], df_merge["na_regiao"])
+
+    # Adiciona nome amigável da cidade
+    df_merge["cidade_amigavel"] = nomes_amigaveis(df_merge["cidade"], nomes_cidades)
+
+    # Define customdata para hover
+    df_merge["customdata"] = list(zip(df_merge["cidade_amigavel"], df_merge["valor_formatado"], df_merge["diferenca_colorida"]))
+    return df_merge
+
+
+def _trace_borda(camada):
+    nome = f"Borda Região {camada['nome']}" if camada.get("nome") else "Borda da região"
+    if camada.get("borda_id"):
+        # Borda como feature do mesmo arquivo estático: nenhuma coordenada vai na figura
+        return go.Choropleth(
+            geojson=camada["geojson"],
+            locations=[camada["borda_id"]],
+            z=[0],
+            featureidkey="id",
+            colorscale=[[0.0, TRANSPARENTE], [1.0, TRANSPARENTE]],
+            showscale=False,
+            marker_line_color="white",
+            marker_line_width=1,
+            name=nome,
+            hoverinfo='skip'
+        )
+
+    return go.Scattergeo(
+        lon=list(camada["lons"]),
+        lat=list(camada["lats"]),
+        mode='lines',
+        line=dict(width=1, color='white'),
+        name=nome,
+        hoverinfo='skip'
+    )
+
+
+def figura_mapa(df_merge, camada, zmin, zmax, titulo_colorbar, nome_escala,
+                rotulo_desvio="Desvio em relação a média histórica"):
+    """``go.Figure`` do mapa a partir das linhas de ``dados_mapa``."""
+    fig = go.Figure()
+
+    fig.add_trace(go.Choropleth(
+        geojson=camada["geojson"],
+        locations=df_merge["cidade"],
+        z=df_merge["z"],
+        featureidkey="id",
+        colorscale=ESCALA_CORES,
+        colorbar=dict(
+            title=titulo_colorbar,
+            thickness=10,
+            len=0.9,
+            x=0.90
+        ),
+        zmin=zmin,
+        zmax=zmax,
+        marker_line_color="white",
+        marker_line_width=0.5,
+        name=nome_escala,
+        customdata=df_merge["customdata"],
+        hovertemplate="<b>%{customdata[0]}</b>" + f"<br>{nome_escala}:</br>" + "%{customdata[1]}</br>" + f"{rotulo_desvio}:<br> %{{customdata[2]}}</br>" + "<extra></extra>",
+    ))
+
+    fig.add_trace(_trace_borda(camada))
+
+    fig.update_geos(fitbounds="locations", visible=False)
+    fig.update_layout(
+        geo=dict(
+            bgcolor=TRANSPARENTE,
+            lakecolor=TRANSPARENTE,
+            showland=True,
+            landcolor=TRANSPARENTE,
+            showlakes=False,
+            showrivers=False,
+            showcoastlines=False,
+            showcountries=False,
+            showsubunits=False,
+            showframe=False,
+            fitbounds="locations"
+        ),
+        paper_bgcolor=TRANSPARENTE,
+        plot_bgcolor=TRANSPARENTE,
+        margin={"r":0,"t":30,"l":0,"b":0},
+        height=400,
+    )
+    return fig
+
+
+def construir_figura(df_filtrado, camada, cidades_regiao, nomes_cidades,
+                     zmin, zmax, titulo_colorbar, nome_escala):
+    """Mapa coroplético de um cenário.
+
+    ``camada`` vem de ``geometria.camada_geometria`` e define se a geometria
+    vai embutida na figura ou referenciada por URL.
+    """
+    df_merge = dados_mapa(df_filtrado, camada["locais"], cidades_regiao, nomes_cidades)
+    return figura_mapa(df_merge, camada, zmin, zmax, titulo_colorbar, nome_escala)
+
+
+def combinacao_indisponivel(cultivo, variavel, modelo):
+    """Combinações sem previsão disponível."""
+    return cultivo == "arroz" and variavel == "rendimento_medio" and modelo == "20 anos"
+
+
+def titulos_escala(variavel, tipo_mapa):
+    """Título da barra de cores e nome da escala do mapa."""
+    nome_variavel = nomes_variaveis_amigaveis.get(variavel, variavel.replace("_", " ").capitalize())
+    if tipo_mapa == "Percentual":
+        return "Percentual de Variação (%)", nome_variavel
+    return nome_variavel, nome_variavel
+
+
+def _executor_figuras():
+    global _executor
+    with _trava_executor:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(TRABALHADORES_FIGURAS, thread_name_prefix="figuras")
+        return _executor
+
+
+def figuras_cenarios(consulta, selecao, camada, cidades_regiao, nomes_cidades,
+                     cenarios=CENARIOS, cache=None, pre_renderizadas=None,
+                     metricas=SEM_METRICAS, exibir=None):
+    """Figura de cada cenário da ``selecao`` (``None`` quando não há dados).
+
+    Com ``cache`` (um ``cache_figuras.CacheLRU`` de figuras), as figuras já
+    construídas são reaproveitadas e a preparação dos dados só roda se
+    faltar alguma delas. Com ``pre_renderizadas`` (de
+    ``pre_renderizar.carregar_pre_renderizadas``), as figuras geradas
+    offline são lidas do disco em vez de construídas. ``metricas`` recebe
+    o tempo de cada etapa e quantas figuras foram construídas ou lidas.
+
+    ``exibir`` restringe as figuras construídas a alguns dos ``cenarios``;
+    a faixa de cores continua sendo calculada sobre todos eles.
+
+    Com ``TRABALHADORES_FIGURAS`` > 1, as figuras dos cenários são
+    construídas em paralelo num pool de threads; o dicionário devolvido
+    segue sempre a ordem dos cenários.
+    """
+    titulo_colorbar, nome_escala = titulos_escala(selecao.variavel, selecao.tipo_mapa)
+    preparados = []
+    trava_preparo = threading.Lock()
+
+    def construir(cenario):
+        if pre_renderizadas is not None:
+            with metricas.etapa("pre_renderizada", cenario):
+                fig = pre_renderizadas.figura(selecao, cenario, camada)
+            if fig is not None:
+                metricas.contar("figuras_pre_renderizadas")
+                return fig
+
+        # A faixa de cores depende de todos os cenários: prepara uma vez só
+        with trava_preparo:
+            if not preparados:
+                preparados.extend(preparar_cenarios(
+                    consulta, selecao.safra, selecao.cultivo, selecao.variavel, selecao.modelo,
+                    selecao.tipo_mapa, selecao.cidade, cidades_regiao, cenarios, metricas
+                ))
+        frames, zmin, zmax = preparados
+
+        df_filtrado = frames[cenario]
+        if df_filtrado.empty:
+            return None
+
+        with metricas.etapa("merge", cenario):
+            df_merge = dados_mapa(df_filtrado, camada["locais"], cidades_regiao, nomes_cidades)
+        with metricas.etapa("figura", cenario):
+            fig = figura_mapa(df_merge, camada, zmin, zmax, titulo_colorbar, nome_escala)
+        metricas.contar("figuras_construidas")
+        return fig
+
+    def obter(cenario):
+        if cache is None:
+            return construir(cenario)
+        # A versão da partição só muda quando os dados desta seleção mudam
+        versao = consulta.versao_particao(safra=selecao.safra, cultivo=selecao.cultivo, modelo=selecao.modelo)
+        chave = (versao, camada["chave"], *selecao, cenario)
+        return cache.obter(chave, lambda: construir(cenario))
+
+    exibidos = list(cenarios if exibir is None else exibir)
+    if TRABALHADORES_FIGURAS > 1 and len(exibidos) > 1:
+        return dict(zip(exibidos, _executor_figuras().map(obter, exibidos)))
+    return {cenario: obter(cenario) for cenario in exibidos}
@@ -0,0 +1,85 @@
+"""Tempos e contadores de cada rerun do aplicativo.
+
+Um ``Metricas`` é criado no início do script e recebe o tempo das etapas do
+caminho crítico (carga, geometria, filtro, preparação, faixa de cores, junção
+com o mapa, construção da figura e ``st.plotly_chart``), por cenário quando
+for o caso, e contadores como o tamanho do payload de cada figura. No fim do
+rerun o resumo vai para o log como uma linha JSON (logger
+``previsao.metricas``) e, opcionalmente, para o painel de desempenho da barra
+lateral.
+"""
+import contextlib
+import json
+import logging
+import sys
+import threading
+import time
+
+from configuracao import LOG_METRICAS
+
+logger = logging.getLogger("previsao.metricas")
+
+if LOG_METRICAS and not logger.handlers:
+    _saida = logging.StreamHandler(sys.stderr)
+    _saida.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_saida)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Metricas:
+    """Tempos (em segundos) e contadores de um rerun."""
+
+    def __init__(self):
+        self.etapas = []
+        self.contadores = {}
+        self._inicio = time.perf_counter()
+        self._trava = threading.Lock()
+
+    @contextlib.contextmanager
+    def etapa(self, nome, cenario=None):
+        """Cronometra o bloco como a etapa ``nome`` (de ``cenario``, se houver)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas.append((nome, cenario, time.perf_counter() - inicio))
+
+    def contar(self, nome, valor=1, cenario=None):
+        # As figuras podem ser construídas em paralelo (ver mapas.figuras_cenarios)
+        with self._trava:
+            chave = (nome, cenario)
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def resumo(self):
+        """Dicionário serializável com o total do rerun, as etapas e os contadores."""
+        return {
+            "total_ms": round((time.perf_counter() - self._inicio) * 1000, 2),
+            "etapas": [
+                {"etapa": nome, "cenario": cenario, "ms": round(segundos * 1000, 2)}
+                for nome, cenario, segundos in self.etapas
+            ],
+            "contadores": [
+                {"contador": nome, "cenario": cenario, "valor": valor}
+                for (nome, cenario), valor in self.contadores.items()
+            ],
+        }
+
+    def registrar(self, **contexto):
+        """Emite o resumo do rerun como uma linha JSON no log."""
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({**contexto, **self.resumo()}, ensure_ascii=False, default=str))
+
+
+class _SemMetricas(Metricas):
+    """Descarta tudo; usado quando quem chama não pediu métricas."""
+
+    @contextlib.contextmanager
+    def etapa(self, nome, cenario=None):
+        yield
+
+    def contar(self, nome, valor=1, cenario=None):
+        pass
+
+
+SEM_METRICAS = _SemMetricas()
@@ -0,0 +1,114 @@
+"""Padronização e nomes de exibição das cidades.
+
+Os nomes de cidade se repetem em milhares de linhas, mas são poucas dezenas
+de nomes distintos. ``padronizar_cidades`` padroniza cada nome distinto uma
+única vez (``factorize`` e ``map`` sobre os valores únicos) e
+``padronizar_nome`` memoriza o resultado de cada nome já visto, de modo que o
+custo acompanha o número de nomes e não o de linhas.
+
+Os nomes padronizados são as chaves das features do GeoJSON; para conferir
+se todos os arquivos usam nomes que existem no mapa::
+
+    python nomes.py
+"""
+import functools
+import sys
+
+import numpy as np
+import pandas as pd
+import unidecode
+
+
+@functools.lru_cache(maxsize=None)
+def padronizar_nome(nome):
+    return unidecode.unidecode(nome.lower().strip())
+
+
+def padronizar_cidades(cidades):
+    """``padronizar_nome`` aplicado a uma coluna de nomes de cidade."""
+    codigos, unicos = pd.factorize(cidades)
+    padronizados = np.asarray(pd.Index(unicos).map(padronizar_nome), dtype=object)
+
+    valores = padronizados[codigos]
+    valores[codigos < 0] = None
+    return pd.Series(valores, index=cidades.index, name=cidades.name)
+
+
+def nomes_sem_geometria(nomes, ids_geojson):
+    """Nomes padronizados sem feature correspondente no GeoJSON, ordenados."""
+    return sorted(set(nomes) - set(ids_geojson))
+
+
+# Chaves padronizadas, como na coluna cidade dos dados
+nomes_cidades_amigaveis = {
+    padronizar_nome(k): v for k, v in {
+        "Agudo": "Agudo",
+        "Cacapava do sul": "Caçapava do Sul",
+        "Cacequi": "Cacequi",
+        "Cachoeira do sul": "Cachoeira do Sul",
+        "Capao do cipo": "Capão do Cipó",
+        "Cerro branco": "Cerro Branco",
+        "Dilermando de aguiar": "Dilermando de Aguiar",
+        "Dona francisca": "Dona Francisca",
+        "Faxinal do soturno": "Faxinal do Soturno",
+        "Formigueiro": "Formigueiro",
+        "Itaara": "Itaara",
+        "Itacurubi": "Itacurubi",
+        "Ivora": "Ivorá",
+        "Jaguari": "Jaguari",
+        "Jari": "Jari",
+        "Julio de castilhos": "Júlio de Castilhos",
+        "Lavras do sul": "Lavras do Sul",
+        "Mata": "Mata",
+        "Nova esperanca do sul": "Nova Esperança do Sul",
+        "Nova palma": "Nova Palma",
+        "Novo cabrais": "Novo Cabrais",
+        "Paraiso do sul": "Paraíso do Sul",
+        "Pinhal grande": "Pinhal Grande",
+        "Quevedos": "Quevedos",
+        "Restinga seca": "Restinga Seca",
+        "Santa margarida do sul": "Santa Margarida do Sul",
+        "Santa maria": "Santa Maria",
+        "Santana da boa vista": "Santana da Boa Vista",
+        "Santiago": "Santiago",
+        "Sao francisco de assis": "São Francisco de Assis",
+        "Sao gabriel": "São Gabriel",
+        "Sao joao do polesine": "São João do Polêsine",
+        "Sao martinho da serra": "São Martinho da Serra",
+        "Sao pedro do sul": "São Pedro do Sul",
+        "Sao sepe": "São Sepé",
+        "Sao vicente do sul": "São Vicente do Sul",
+        "Silveira martins": "Silveira Martins",
+        "Toropi": "Toropi",
+        "Unistalda": "Unistalda",
+        "Vila nova do sul": "Vila Nova do Sul"
+    }.items()
+}
+
+# Nome de exibição -> nome padronizado (para o seletor de cidade)
+nomes_cidades_invertido = {v: k for k, v in nomes_cidades_amigaveis.items()}
+
+
+def validar_nomes():
+    """Nomes de cada origem que não correspondem a nenhuma feature do GeoJSON."""
+    # Importado aqui: dados e regioes usam este módulo para padronizar os nomes
+    from dados import carregar_geojson, carregar_medias, carregar_previsoes
+    from regioes import PADRAO_ARQUIVO, carregar_regioes
+
+    ids = [f["id"] for f in carregar_geojson()["features"]]
+    origens = {
+        **{PADRAO_ARQUIVO.format(r.codigo): sorted(r.cidades) for r in carregar_regioes().values()},
+        "previsões": carregar_previsoes()["cidade"].unique(),
+        "médias históricas": carregar_medias()["cidade"].unique(),
+        "nomes_cidades_amigaveis": list(nomes_cidades_amigaveis),
+    }
+    return {origem: nomes_sem_geometria(nomes, ids) for origem, nomes in origens.items()}
+
+
+if __name__ == "__main__":
+    faltando = {origem: nomes for origem, nomes in validar_nomes().items() if nomes}
+    for origem, nomes in faltando.items():
+        print(f"{origem}: sem feature no GeoJSON: {', '.join(nomes)}")
+    if faltando:
+        sys.exit(1)
+    print("Todos os nomes correspondem a features do GeoJSON.")
@@ -0,0 +1,229 @@
+"""Pré-renderização offline dos mapas de cenário.
+
+Percorre todas as combinações de (safra, cultivo, variável, modelo, tipo de
+mapa) que têm previsão, com "Todas" as cidades, e grava os quatro mapas de
+cada uma em JSON, HTML e/ou PNG, em paralelo num pool de processos. A
+filtragem e a construção das figuras são as mesmas do aplicativo
+(``mapas.figuras_cenarios``).
+
+A saída pode ir para trás de uma CDN, e o aplicativo também serve os JSON
+diretamente: ``manifesto.json`` registra o hash dos dados de origem e a
+geometria usados, e ``carregar_pre_renderizadas`` só aproveita os mapas
+enquanto os dois continuarem os mesmos.
+
+Uso::
+
+    python pre_renderizar.py --formatos json html --processos 8
+
+PNG exige o pacote ``kaleido``.
+"""
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+
+from configuracao import DIRETORIO_PRE_RENDERIZADOS, MODO_GEOMETRIA
+from consultas import consulta_previsoes
+from dados import (
+    arquivos_previsoes,
+    caminho,
+    carregar_com_cache,
+    hash_arquivo,
+)
+from geometria import MODOS_GEOMETRIA, camada_geometria
+from mapas import TIPOS_MAPA, Selecao, combinacao_indisponivel, figuras_cenarios
+from nomes import nomes_cidades_amigaveis, padronizar_nome
+from regioes import regiao
+
+FORMATOS = ("json", "html", "png")
+
+NOME_MANIFESTO = "manifesto.json"
+
+# Estado de cada processo do pool, montado uma vez em _iniciar_processo
+_estado = {}
+
+
+def _slug(texto):
+    return padronizar_nome(str(texto)).replace(" ", "_")
+
+
+def nome_combinacao(selecao):
+    """Nome da pasta com os mapas de ``selecao``."""
+    return "_".join(_slug(v) for v in (
+        selecao.safra, selecao.cultivo, selecao.variavel, selecao.modelo, selecao.tipo_mapa
+    ))
+
+
+def combinacoes(consulta):
+    """Todas as seleções com previsão disponível, com "Todas" as cidades."""
+    produto = itertools.product(
+        consulta.opcoes("safra"),
+        consulta.opcoes("cultivo"),
+        consulta.opcoes("variavel_alvo"),
+        consulta.opcoes("modelo"),
+        TIPOS_MAPA,
+    )
+    for safra, cultivo, variavel, modelo, tipo_mapa in produto:
+        if combinacao_indisponivel(cultivo, variavel, modelo):
+            continue
+        yield Selecao(safra, cultivo, variavel, modelo, tipo_mapa, "Todas")
+
+
+def _iniciar_processo(modo_geometria):
+    escolhida = regiao()
+    _estado["consulta"] = consulta_previsoes()
+    _estado["cidades"] = escolhida.cidades
+    _estado["camada"] = camada_geometria(escolhida.cidades, modo_geometria, nome=escolhida.nome)
+
+
+def _renderizar(selecao, diretorio, formatos):
+    figuras = figuras_cenarios(
+        _estado["consulta"], selecao, _estado["camada"], _estado["cidades"], nomes_cidades_amigaveis
+    )
+
+    pasta = nome_combinacao(selecao)
+    os.makedirs(os.path.join(diretorio, pasta), exist_ok=True)
+
+    arquivos = {}
+    for cenario, fig in figuras.items():
+        if fig is None:
+            continue
+
+        for formato in formatos:
+            relativo = f"{pasta}/{cenario}.{formato}"
+            destino = os.path.join(diretorio, relativo)
+            if formato == "json":
+                # Sem o template: quem lê aplica o seu (o aplicativo usa o tema do Streamlit)
+                conteudo = fig.to_dict()
+                conteudo["layout"].pop("template", None)
+                with open(destino, "w", encoding="utf-8") as f:
+                    f.write(pio.to_json(conteudo, validate=False))
+            elif formato == "html":
+                fig.write_html(destino, include_plotlyjs="cdn")
+            else:
+                fig.write_image(destino)
+
+        arquivos[cenario] = f"{pasta}/{cenario}"
+
+    return pasta, arquivos
+
+
+def pre_renderizar(diretorio, formatos, processos=None, modo_geometria="embutido"):
+    """Renderiza todas as combinações em ``diretorio`` e grava o manifesto."""
+    formatos = list(formatos)
+    desconhecidos = set(formatos) - set(FORMATOS)
+    if desconhecidos:
+        raise ValueError(f"Formatos desconhecidos: {sorted(desconhecidos)}; use {FORMATOS}")
+    if modo_geometria == "estatico" and set(formatos) & {"html", "png"}:
+        raise ValueError("HTML e PNG precisam da geometria embutida (--geometria embutido)")
+    if "png" in formatos:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            raise ValueError("Exportar PNG exige o pacote kaleido (pip install kaleido)") from None
+
+    os.makedirs(diretorio, exist_ok=True)
+
+    # O manifesto antigo sai primeiro: mapas pela metade nunca são servidos
+    manifesto_antigo = os.path.join(diretorio, NOME_MANIFESTO)
+    if os.path.exists(manifesto_antigo):
+        os.remove(manifesto_antigo)
+
+    selecoes = list(combinacoes(consulta_previsoes()))
+    with ProcessPoolExecutor(
+        max_workers=processos,
+        initializer=_iniciar_processo,
+        initargs=(modo_geometria,),
+    ) as pool:
+        resultados = list(pool.map(
+            _renderizar,
+            selecoes,
+            itertools.repeat(diretorio),
+            itertools.repeat(formatos),
+            chunksize=4,
+        ))
+
+    manifesto = {
+        "origem": {arquivo: hash_arquivo(arquivo) for arquivo in arquivos_previsoes()},
+        "geometria": camada_geometria(regiao().cidades, modo_geometria)["chave"],
+        "formatos": formatos,
+        "mapas": dict(resultados),
+    }
+    with open(manifesto_antigo, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+
+    return manifesto
+
+
+class PreRenderizadas:
+    """Mapas JSON pré-renderizados, servidos no lugar dos construídos na hora."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        with open(os.path.join(diretorio, NOME_MANIFESTO), encoding="utf-8") as f:
+            self.manifesto = json.load(f)
+
+        atual = {arquivo: hash_arquivo(arquivo) for arquivo in arquivos_previsoes()}
+        self.valido = (
+            self.manifesto["origem"] == atual and "json" in self.manifesto["formatos"]
+        )
+
+    def figura(self, selecao, cenario, camada):
+        """Figura pré-renderizada, ou ``None`` se não houver uma válida."""
+        if not self.valido or selecao.cidade != "Todas":
+            return None
+        if camada["chave"] != self.manifesto["geometria"]:
+            return None
+
+        arquivo = self.manifesto["mapas"].get(nome_combinacao(selecao), {}).get(cenario)
+        if arquivo is None:
+            return None
+
+        return pio.read_json(os.path.join(self.diretorio, f"{arquivo}.json"))
+
+
+def carregar_pre_renderizadas(diretorio=DIRETORIO_PRE_RENDERIZADOS):
+    """``PreRenderizadas`` de ``diretorio``, ou ``None`` se não houver manifesto."""
+    diretorio = caminho(diretorio)
+    manifesto = os.path.join(diretorio, NOME_MANIFESTO)
+    if not os.path.exists(manifesto):
+        return None
+
+    return carregar_com_cache(
+        ("pre_renderizadas", diretorio),
+        [manifesto, *arquivos_previsoes()],
+        lambda: PreRenderizadas(diretorio),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--saida", default=caminho(DIRETORIO_PRE_RENDERIZADOS),
+                        help="diretório de saída (padrão: %(default)s)")
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS, default=["json"],
+                        help="formatos gerados (padrão: json)")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="processos em paralelo (padrão: um por CPU)")
+    parser.add_argument("--geometria", choices=MODOS_GEOMETRIA, default=None,
+                        help="modo da geometria; HTML e PNG exigem 'embutido' "
+                             "(padrão: o do aplicativo para JSON, 'embutido' para os demais)")
+    args = parser.parse_args()
+
+    modo = args.geometria
+    if modo is None:
+        modo = MODO_GEOMETRIA if args.formatos == ["json"] else "embutido"
+
+    try:
+        manifesto = pre_renderizar(args.saida, args.formatos, args.processos, modo)
+    except ValueError as erro:
+        parser.error(str(erro))
+
+    total = sum(len(mapas) for mapas in manifesto["mapas"].values())
+    print(f"{len(manifesto['mapas'])} combinações, {total} mapas em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Registro das Regiões Geográficas Intermediárias e busca espacial de municípios.
+
+Cada região é descrita por um arquivo ``regiao-intermediaria-<codigo>.txt``
+com um município por linha; basta acrescentar o arquivo para que a região
+apareça no aplicativo. O registro guarda, para cada região, o conjunto dos
+nomes padronizados dos municípios (os ``id`` das features do GeoJSON), de modo
+que testar se uma cidade pertence à região é O(1), e o caminho inverso,
+município -> região.
+
+``IndiceMunicipios`` responde qual município contém uma coordenada (lon, lat)
+com uma STRtree sobre os 497 polígonos do GeoJSON, sem percorrer todos.
+"""
+import glob
+import os
+from collections import namedtuple
+
+from configuracao import REGIAO_PADRAO
+from dados import ARQUIVO_GEOJSON, DIRETORIO, caminho, carregar_com_cache, carregar_geojson
+from nomes import padronizar_nome
+
+PADRAO_ARQUIVO = "regiao-intermediaria-{}.txt"
+
+# Nomes das regiões do RS pelo código usado no nome do arquivo
+NOMES_REGIOES = {
+    "sm": "Santa Maria",
+    "poa": "Porto Alegre",
+    "cxs": "Caxias do Sul",
+    "pf": "Passo Fundo",
+    "pel": "Pelotas",
+    "scs": "Santa Cruz do Sul - Lajeado",
+    "iju": "Ijuí",
+    "urg": "Uruguaiana",
+}
+
+Regiao = namedtuple("Regiao", ["codigo", "nome", "cidades"])
+
+
+def arquivos_regioes():
+    """Arquivos de região presentes, ordenados pelo código."""
+    arquivos = glob.glob(os.path.join(DIRETORIO, PADRAO_ARQUIVO.format("*")))
+    return sorted(os.path.basename(a) for a in arquivos)
+
+
+def _codigo(arquivo):
+    prefixo, sufixo = PADRAO_ARQUIVO.split("{}")
+    return arquivo[len(prefixo):-len(sufixo)]
+
+
+def _ler_regioes(arquivos):
+    regioes = {}
+    for arquivo in arquivos:
+        codigo = _codigo(arquivo)
+        with open(caminho(arquivo), encoding="utf-8") as f:
+            cidades = frozenset(padronizar_nome(linha) for linha in f if linha.strip())
+        regioes[codigo] = Regiao(codigo, NOMES_REGIOES.get(codigo, codigo.upper()), cidades)
+    return regioes
+
+
+def carregar_regioes():
+    """Código -> ``Regiao`` de todas as regiões com arquivo."""
+    arquivos = arquivos_regioes()
+    return carregar_com_cache(("regioes", tuple(arquivos)), arquivos, lambda: _ler_regioes(arquivos))
+
+
+def regiao(codigo=REGIAO_PADRAO):
+    """A ``Regiao`` de ``codigo`` (por padrão, a de ``PREVISAO_REGIAO``)."""
+    regioes = carregar_regioes()
+    if codigo not in regioes:
+        raise KeyError(f"Região desconhecida: {codigo!r}; disponíveis: {sorted(regioes)}")
+    return regioes[codigo]
+
+
+def regioes_por_cidade():
+    """Nome padronizado do município -> código da região."""
+    return {cidade: r.codigo for r in carregar_regioes().values() for cidade in r.cidades}
+
+
+class IndiceMunicipios:
+    """Busca do município que contém uma coordenada, com STRtree."""
+
+    def __init__(self, features):
+        from shapely import STRtree
+        from shapely.geometry import shape
+
+        self.ids = [f["id"] for f in features]
+        self.arvore = STRtree([shape(f["geometry"]) for f in features])
+
+    def municipios(self, lons, lats):
+        """``id`` do município de cada ponto (``None`` fora do RS)."""
+        import shapely
+
+        pontos = shapely.points(lons, lats)
+        encontrados = [None] * len(pontos)
+        # covered_by inclui a borda: um ponto na divisa é coberto pelos dois
+        # municípios e fica com o que vem primeiro no GeoJSON
+        for ponto, indice in self.arvore.query(pontos, predicate="covered_by").T.tolist():
+            if encontrados[ponto] is None or indice < encontrados[ponto]:
+                encontrados[ponto] = indice
+        return [None if indice is None else self.ids[indice] for indice in encontrados]
+
+    def municipio(self, lon, lat):
+        return self.municipios([lon], [lat])[0]
+
+
+def indice_municipios():
+    """``IndiceMunicipios`` de todos os municípios do GeoJSON, criado uma vez."""
+    return carregar_com_cache(
+        "indice_municipios",
+        [ARQUIVO_GEOJSON],
+        lambda: IndiceMunicipios(carregar_geojson()["features"]),
+    )
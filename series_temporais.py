@@ -0,0 +1,168 @@
+"""Séries temporais das previsões em todas as safras, por cenário SSP.
+
+Para cada (cultivo, variável, modelo) os agregados da região são calculados
+uma única vez por versão dos dados e guardados em cache:
+
+* ``quantidade_produzida``: soma das cidades em cada (cenário, safra);
+* ``rendimento_medio``: média e percentis (``PERCENTIS``) das cidades em
+  cada (cenário, safra), só com as cidades que têm rendimento positivo
+  (as que não plantam o cultivo ficam com zero).
+
+A média histórica (``valor_media``) entra como linha de base, agregada da
+mesma forma. ``figura_serie`` desenha uma linha por cenário (com a faixa
+entre os percentis, no rendimento) ou, para uma cidade, as previsões dela.
+"""
+from collections import namedtuple
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from cache_figuras import CacheLRU
+from configuracao import LIMITE_CACHE_AGREGADOS_MB
+from mapas import CENARIOS, TRANSPARENTE, nomes_variaveis_amigaveis
+
+PERCENTIS = (0.1, 0.5, 0.9)
+
+CORES_CENARIOS = {
+    "ssp126": "#1a9850",
+    "ssp245": "#125ED1",
+    "ssp370": "#fa992a",
+    "ssp585": "#d61515",
+}
+
+# ``regional``: uma linha por (cenario, safra) com ``valor`` e, no rendimento,
+# ``p10``/``p50``/``p90``; ``cidades``: as linhas de cada cidade, ordenadas;
+# ``base_regional``: média histórica agregada; ``base_cidades``: cidade -> média
+Agregados = namedtuple("Agregados", ["variavel", "regional", "cidades", "base_regional", "base_cidades"])
+
+
+def nome_percentil(percentil):
+    return f"p{round(percentil * 100)}"
+
+
+def _agregar(df, variavel):
+    grupos = df.groupby(["cenario", "safra"], observed=True)["valor"]
+    medias = df.drop_duplicates("cidade").set_index("cidade")["valor_media"]
+
+    if variavel == "quantidade_produzida":
+        return grupos.sum().to_frame("valor"), medias.sum()
+
+    positivos = df[df["valor"] > 0].groupby(["cenario", "safra"], observed=True)["valor"]
+    percentis = positivos.quantile(list(PERCENTIS)).unstack()
+    percentis.columns = [nome_percentil(p) for p in percentis.columns]
+    regional = positivos.mean().to_frame("valor").join(percentis).reindex(grupos.size().index)
+    return regional, medias[medias > 0].mean()
+
+
+def calcular_agregados(consulta, cidades_regiao, cultivo, variavel, modelo):
+    """``Agregados`` de (``cultivo``, ``variavel``, ``modelo``) nas cidades da região."""
+    df = consulta.filtrar(cultivo=cultivo, variavel_alvo=variavel, modelo=modelo)
+    df = df[df["cidade"].isin(cidades_regiao)]
+
+    regional, base_regional = _agregar(df, variavel)
+    cidades = df[["cidade", "cenario", "safra", "valor"]].sort_values(["cidade", "cenario", "safra"])
+    base_cidades = df.drop_duplicates("cidade").set_index("cidade")["valor_media"]
+    return Agregados(
+        variavel,
+        regional.reset_index(),
+        cidades.reset_index(drop=True),
+        base_regional,
+        base_cidades.to_dict(),
+    )
+
+
+def tamanho_agregados(agregados):
+    """Bytes dos DataFrames de ``agregados``."""
+    return int(
+        agregados.regional.memory_usage(deep=True).sum()
+        + agregados.cidades.memory_usage(deep=True).sum()
+    )
+
+
+cache_agregados = CacheLRU(LIMITE_CACHE_AGREGADOS_MB, tamanho=tamanho_agregados)
+
+
+def agregados_serie(consulta, cidades_regiao, cultivo, variavel, modelo):
+    """``Agregados`` do cache; só são recalculados quando alguma partição usada muda."""
+    # As partições são (safra, cultivo, modelo): a série usa as de todas as safras
+    versoes = tuple(
+        consulta.versao_particao(safra=safra, cultivo=cultivo, modelo=modelo)
+        for safra in consulta.opcoes("safra")
+    )
+    chave = (versoes, frozenset(cidades_regiao), cultivo, variavel, modelo)
+    return cache_agregados.obter(
+        chave, lambda: calcular_agregados(consulta, cidades_regiao, cultivo, variavel, modelo)
+    )
+
+
+def _linha_base(fig, valor, texto):
+    if pd.notna(valor):
+        fig.add_hline(
+            y=valor, line_dash="dash", line_color="gray",
+            annotation_text=texto, annotation_position="top left",
+        )
+
+
+def _faixa(fig, linhas, cenario, cor):
+    inferior, superior = nome_percentil(PERCENTIS[0]), nome_percentil(PERCENTIS[-1])
+    fig.add_trace(go.Scatter(
+        x=linhas["safra"], y=linhas[superior], mode="lines", line=dict(width=0),
+        legendgroup=cenario, showlegend=False, hoverinfo="skip",
+    ))
+    fig.add_trace(go.Scatter(
+        x=linhas["safra"], y=linhas[inferior], mode="lines", line=dict(width=0),
+        fill="tonexty", fillcolor=_transparente(cor), legendgroup=cenario,
+        showlegend=False, hoverinfo="skip",
+    ))
+
+
+def _transparente(cor, opacidade=0.15):
+    r, g, b = (int(cor[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({r},{g},{b},{opacidade})"
+
+
+def figura_serie(agregados, cidade="Todas", nome_cidade=None, cenarios=CENARIOS):
+    """Linhas das previsões em todas as safras, uma por cenário, com a média histórica.
+
+    Com ``cidade="Todas"`` mostra o agregado da região (soma ou média com
+    faixa de percentis, conforme a variável); caso contrário, a cidade.
+    """
+    nome_variavel = nomes_variaveis_amigaveis.get(agregados.variavel, agregados.variavel)
+    fig = go.Figure()
+
+    if cidade == "Todas":
+        linhas = agregados.regional
+        base = agregados.base_regional
+        com_faixa = agregados.variavel == "rendimento_medio"
+        titulo = "Região (média das cidades)" if com_faixa else "Região (soma das cidades)"
+    else:
+        linhas = agregados.cidades[agregados.cidades["cidade"] == cidade]
+        base = agregados.base_cidades.get(cidade)
+        com_faixa = False
+        titulo = nome_cidade or cidade
+
+    for cenario in cenarios:
+        do_cenario = linhas[linhas["cenario"] == cenario]
+        if do_cenario.empty:
+            continue
+        cor = CORES_CENARIOS.get(cenario)
+        if com_faixa and cor:
+            _faixa(fig, do_cenario, cenario, cor)
+        fig.add_trace(go.Scatter(
+            x=do_cenario["safra"], y=do_cenario["valor"], mode="lines+markers",
+            line=dict(color=cor), legendgroup=cenario, name=cenario.upper(),
+            hovertemplate=f"{cenario.upper()}<br>Safra %{{x}}: %{{y:.2f}}<extra></extra>",
+        ))
+
+    _linha_base(fig, base, "Média histórica")
+    fig.update_layout(
+        title=titulo,
+        xaxis_title="Safra",
+        yaxis_title=nome_variavel,
+        xaxis=dict(dtick=1),
+        paper_bgcolor=TRANSPARENTE,
+        plot_bgcolor=TRANSPARENTE,
+        margin={"r": 0, "t": 40, "l": 0, "b": 0},
+        height=400,
+    )
+    return fig
@@ -0,0 +1,41 @@
+"""``CacheLRU``: limite pelo tamanho das entradas e descarte das menos usadas."""
+from cache_figuras import CacheLRU, limpar_caches
+
+MB = 1024 * 1024
+
+
+def test_descarta_as_menos_usadas():
+    cache = CacheLRU(3 / MB, tamanho=lambda item: item["bytes"])
+    for chave in "abc":
+        cache.obter(chave, lambda: {"bytes": 1})
+
+    cache.obter("a", lambda: None)  # acerto: "a" passa a ser a mais recente
+    cache.obter("d", lambda: {"bytes": 2})
+
+    assert [c for c in "abcd" if cache.obter(c, lambda: None) is not None] == ["a", "d"]
+    estatisticas = cache.estatisticas()
+    assert estatisticas["descartes"] == 2
+    assert estatisticas["tamanho_mb"] * MB == 3
+
+
+def test_nao_guarda_none_nem_itens_maiores_que_o_limite():
+    cache = CacheLRU(4 / MB)
+    assert cache.obter("vazio", lambda: None) is None
+    assert cache.obter("grande", lambda: b"12345") == b"12345"
+    assert cache.obter("pequeno", lambda: b"123") == b"123"
+
+    construidos = []
+    cache.obter("grande", lambda: construidos.append(1) or b"12345")
+    cache.obter("pequeno", lambda: construidos.append(1) or b"123")
+    assert construidos == [1]
+    assert cache.estatisticas()["entradas"] == 1
+
+
+def test_limpar_caches_esvazia_todas_as_instancias():
+    caches = [CacheLRU(1), CacheLRU(1, tamanho=lambda item: 1)]
+    for cache in caches:
+        cache.obter("chave", lambda: "valor")
+
+    limpar_caches()
+
+    assert all(cache.estatisticas()["entradas"] == 0 for cache in caches)
@@ -0,0 +1,94 @@
+"""Compara as funções de ``calculos`` com as expressões linha a linha que elas substituíram."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculos import (
+    diferenca_media,
+    formatar_diferencas,
+    formatar_valores,
+    percentual_variacao,
+    valores_mapa,
+)
+
+
+# --- Versões originais do app.py, aplicadas linha a linha ---
+
+def _percentual_antigo(row):
+    return ((row["valor"] - row["valor_media"]) / row["valor_media"]) * 100 \
+        if row["valor_media"] != 0 and row["valor"] > 0 else 0
+
+
+def _diferenca_antiga(row):
+    return row["valor"] - row["valor_media"] if row["valor"] > 0 else 0
+
+
+def _formatar_valor_antigo(x, vazio="Sem dado"):
+    return f"{x:.2f}" if pd.notna(x) else vazio
+
+
+def _formatar_diferenca_antiga(diff):
+    if pd.isna(diff):
+        return "Média indisponível"
+    bolinha = "🟢" if diff >= 0 else "🔴"
+    sinal = "+" if diff >= 0 else ""
+    return f"{bolinha} {sinal}{diff:.2f}"
+
+
+def _z_antigo(row):
+    return row["z_valor"] if row["regiao_santa_maria"] and pd.notna(row["z_valor"]) \
+        else (-9999 if not row["regiao_santa_maria"] else None)
+
+
+@pytest.fixture
+def df():
+    # Casos de borda: média zero, média ausente, valor <= 0 e valor ausente
+    casos = pd.DataFrame({
+        "valor": [120.0, 80.0, 50.0, 50.0, 0.0, -3.0, np.nan, np.nan, 0.0, 1e-3],
+        "valor_media": [100.0, 100.0, 0.0, np.nan, 100.0, 100.0, 100.0, np.nan, 0.0, 3.0],
+    })
+    aleatorio = np.random.default_rng(0)
+    sorteados = pd.DataFrame({
+        "valor": aleatorio.choice([0.0, -1.0, np.nan, 5.5, 1234.567], 500) * aleatorio.random(500),
+        "valor_media": aleatorio.choice([0.0, np.nan, 10.0, 987.654], 500),
+    })
+    return pd.concat([casos, sorteados], ignore_index=True)
+
+
+def test_percentual_variacao(df):
+    esperado = df.apply(_percentual_antigo, axis=1).to_numpy(dtype=float)
+    np.testing.assert_array_equal(percentual_variacao(df["valor"], df["valor_media"]), esperado)
+
+
+def test_percentual_variacao_casos_de_borda():
+    valor = [50.0, 50.0, 0.0, -3.0, np.nan]
+    valor_media = [0.0, np.nan, 100.0, 100.0, 100.0]
+    np.testing.assert_array_equal(percentual_variacao(valor, valor_media), [0.0, np.nan, 0.0, 0.0, 0.0])
+
+
+def test_diferenca_media(df):
+    esperado = df.apply(_diferenca_antiga, axis=1).to_numpy(dtype=float)
+    np.testing.assert_array_equal(diferenca_media(df["valor"], df["valor_media"]), esperado)
+
+
+def test_formatar_valores(df):
+    assert list(formatar_valores(df["valor"])) == [_formatar_valor_antigo(x) for x in df["valor"]]
+    assert list(formatar_valores(df["valor"], vazio="")) == [_formatar_valor_antigo(x, "") for x in df["valor"]]
+
+
+def test_formatar_diferencas(df):
+    for diferencas in (
+        diferenca_media(df["valor"], df["valor_media"]),
+        percentual_variacao(df["valor"], df["valor_media"]),
+    ):
+        esperado = [_formatar_diferenca_antiga(d) for d in diferencas]
+        assert list(formatar_diferencas(diferencas)) == esperado
+
+
+def test_valores_mapa(df):
+    df = df.assign(
+        z_valor=percentual_variacao(df["valor"], df["valor_media"]),
+        regiao_santa_maria=np.arange(len(df)) % 3 != 0,
+    )
+    esperado = df.apply(_z_antigo, axis=1).to_numpy(dtype=float)
+    np.testing.assert_array_equal(valores_mapa(df["z_valor"], df["regiao_santa_maria"]), esperado)
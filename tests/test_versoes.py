@@ -0,0 +1,184 @@
+"""Atualização incremental das previsões (``ConsultaIndexada.substituir`` e ``versoes``)."""
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import armazem
+import dados
+import versoes
+from cache_figuras import CacheLRU
+from consultas import CHAVES_PARTICAO, CHAVES_PREVISOES, ConsultaIndexada
+from dados import ARQUIVO_PREVISOES, ARQUIVOS_MEDIAS, arquivos_previsoes, assinatura_arquivo
+
+
+def _tabela():
+    linhas = [
+        (safra, cultivo, variavel, modelo, cenario, cidade)
+        for safra in (2030, 2031)
+        for cultivo in ("soja", "arroz")
+        for variavel in ("rendimento_medio",)
+        for modelo in ("20 anos", "30 anos")
+        for cenario in ("ssp126", "ssp585")
+        for cidade in ("santa maria", "cacequi", "agudo")
+    ]
+    df = pd.DataFrame(linhas, columns=[*CHAVES_PREVISOES, "cidade"])
+    df["valor"] = np.arange(len(df), dtype=float)
+    for coluna in ("cultivo", "variavel_alvo", "modelo", "cenario", "cidade"):
+        df[coluna] = df[coluna].astype("category")
+    return df
+
+
+def _normalizada(df):
+    """``df`` com as categorias como texto, ordenado e sem o índice, para comparar conteúdo."""
+    df = df.astype({c: str for c, t in df.dtypes.items() if isinstance(t, pd.CategoricalDtype)})
+    return df.sort_values([*CHAVES_PREVISOES, "cidade"]).reset_index(drop=True)
+
+
+def _mesmas_fatias(consulta, esperada):
+    assert set(consulta._fatias) == set(esperada._fatias)
+    for chave in esperada._fatias:
+        pd.testing.assert_frame_equal(_normalizada(consulta.fatia(*chave)), _normalizada(esperada.fatia(*chave)))
+
+
+def test_substituir_equivale_a_indexar_de_novo():
+    df = _tabela()
+    consulta = ConsultaIndexada(df, CHAVES_PREVISOES, CHAVES_PARTICAO)
+
+    # Partição alterada (com uma cidade nova), partição removida e partição nova
+    alterada = (2030, "soja", "20 anos")
+    removida = (2031, "arroz", "30 anos")
+    nova = (2032, "soja", "20 anos")
+    em = lambda d, p: (d["safra"] == p[0]) & (d["cultivo"] == p[1]) & (d["modelo"] == p[2])
+
+    df_novo = df[em(df, alterada)].astype({"cidade": str, "cenario": str})
+    df_novo["valor"] = df_novo["valor"] * 2
+    df_novo.loc[df_novo.index[0], "cidade"] = "dilermando de aguiar"
+    df_nova = df[em(df, alterada)].assign(safra=2032)
+    df_novo = pd.concat([df_novo, df_nova])
+
+    resultado = consulta.substituir({alterada, removida, nova}, df_novo)
+    completa = pd.concat([df[~em(df, alterada) & ~em(df, removida)], df_novo])
+    _mesmas_fatias(resultado, ConsultaIndexada(completa, CHAVES_PREVISOES, CHAVES_PARTICAO))
+
+    for coluna in ("cidade", "cenario", "cultivo"):
+        assert isinstance(resultado.df[coluna].dtype, pd.CategoricalDtype)
+    assert "dilermando de aguiar" in resultado.df["cidade"].cat.categories
+
+    # Só as partições trocadas mudam de versão; a consulta original continua válida
+    mantida = dict(safra=2031, cultivo="soja", modelo="30 anos")
+    assert resultado.versao_particao(**mantida) == consulta.versao_particao(**mantida)
+    assert resultado.versao_particao(safra=2030, cultivo="soja", modelo="20 anos") == resultado.versao
+    assert resultado.versao_particao(safra=2032, cultivo="soja", modelo="20 anos") == resultado.versao
+    assert resultado.fatia(2031, "arroz", "rendimento_medio", "30 anos", "ssp126").empty
+    _mesmas_fatias(consulta, ConsultaIndexada(df, CHAVES_PREVISOES, CHAVES_PARTICAO))
+
+
+def test_particoes_alteradas():
+    df = _tabela()
+    consulta = ConsultaIndexada(df, CHAVES_PREVISOES, CHAVES_PARTICAO)
+
+    # Mesmo conteúdo, com as categorias em texto: nada mudou
+    assert versoes.particoes_alteradas(consulta, df.astype(str).astype({"safra": int, "valor": float})) == set()
+
+    novo = df[~((df["safra"] == 2031) & (df["cultivo"] == "arroz") & (df["modelo"] == "30 anos"))].copy()
+    novo.loc[(novo["safra"] == 2030) & (novo["cultivo"] == "soja") & (novo["modelo"] == "20 anos"), "valor"] += 1
+    extra = novo[(novo["safra"] == 2030) & (novo["cultivo"] == "arroz") & (novo["modelo"] == "20 anos")]
+    novo = pd.concat([novo, extra.assign(safra=2040)])
+
+    assert versoes.particoes_alteradas(consulta, novo) == {
+        (2030, "soja", "20 anos"),
+        (2031, "arroz", "30 anos"),
+        (2040, "arroz", "20 anos"),
+    }
+
+
+@pytest.fixture
+def diretorio_dados(tmp_path, monkeypatch):
+    """Cópia dos arquivos de dados (e do armazém, se houver) em um diretório temporário."""
+    for arquivo in arquivos_previsoes():
+        if arquivo != armazem.ARQUIVO_MANIFESTO:
+            shutil.copy2(dados.caminho(arquivo), tmp_path / arquivo)
+    if armazem.armazem_valido():
+        shutil.copytree(armazem.DIRETORIO_ARMAZEM, tmp_path / "armazem")
+
+    monkeypatch.setattr(dados, "DIRETORIO", str(tmp_path))
+    monkeypatch.setattr(armazem, "DIRETORIO_ARMAZEM", str(tmp_path / "armazem"))
+    dados.limpar_cache()
+    yield tmp_path
+    dados.limpar_cache()
+
+
+def _reescrever(diretorio, arquivo, alterar):
+    df = pd.read_csv(diretorio / arquivo)
+    alterar(df)
+    df.to_csv(diretorio / arquivo, index=False)
+
+
+def _atualizada_e_completa():
+    arquivos = arquivos_previsoes()
+    assinaturas = {a: assinatura_arquivo(a) for a in arquivos}
+    atual = versoes._atual
+    return versoes._atualizar(atual, arquivos, assinaturas), versoes._carregar_completa(arquivos, assinaturas)
+
+
+def test_atualizar_previsoes_equivale_a_recarregar(diretorio_dados):
+    anterior = versoes.versao_atual()
+    tipos = anterior.consulta.df.dtypes
+
+    def alterar(df):
+        safra = df["safra"].min()
+        df.loc[(df["safra"] == safra) & (df["cultivo"] == "soja"), "valor"] *= 1.5
+        df.drop(df.index[df["safra"] == df["safra"].max()], inplace=True)
+
+    _reescrever(diretorio_dados, ARQUIVO_PREVISOES, alterar)
+    atualizada, completa = _atualizada_e_completa()
+
+    assert atualizada.consulta is not anterior.consulta
+    _mesmas_fatias(atualizada.consulta, completa.consulta)
+    pd.testing.assert_frame_equal(
+        _normalizada(atualizada.consulta.df), _normalizada(completa.consulta.df), check_dtype=False
+    )
+    # As colunas categóricas da versão anterior continuam categóricas
+    for coluna, tipo in tipos.items():
+        if isinstance(tipo, pd.CategoricalDtype):
+            assert isinstance(atualizada.consulta.df[coluna].dtype, pd.CategoricalDtype), coluna
+
+
+def test_atualizar_medias_equivale_a_recarregar(diretorio_dados):
+    anterior = versoes.versao_atual()
+    arquivo = next(iter(ARQUIVOS_MEDIAS))
+    _, cultivo, modelo = ARQUIVOS_MEDIAS[arquivo]
+
+    def alterar(df):
+        coluna = next(c for c in df.columns if c.startswith("media_"))
+        df[coluna] = df[coluna] + 10
+
+    _reescrever(diretorio_dados, arquivo, alterar)
+    atualizada, completa = _atualizada_e_completa()
+
+    _mesmas_fatias(atualizada.consulta, completa.consulta)
+    pd.testing.assert_frame_equal(
+        _normalizada(atualizada.consulta.df), _normalizada(completa.consulta.df), check_dtype=False
+    )
+    # Só as partições do cultivo e período do arquivo mudam de versão
+    for safra in anterior.consulta.opcoes("safra"):
+        for outro_cultivo in anterior.consulta.opcoes("cultivo"):
+            for outro_modelo in anterior.consulta.opcoes("modelo"):
+                particao = dict(safra=safra, cultivo=outro_cultivo, modelo=outro_modelo)
+                mudou = atualizada.consulta.versao_particao(**particao) != anterior.consulta.versao_particao(**particao)
+                assert mudou == (outro_cultivo == cultivo and outro_modelo == modelo)
+
+
+def test_limpar_cache_descarta_versao_e_caches(diretorio_dados):
+    cache = CacheLRU(1)
+    anterior = versoes.versao_atual()
+    cache.obter((anterior.consulta.versao, "figura"), lambda: "{}")
+    assert cache.estatisticas()["entradas"] == 1
+
+    dados.limpar_cache()
+
+    assert versoes._atual is None
+    assert cache.estatisticas()["entradas"] == 0
+    assert versoes.versao_atual().numero != anterior.numero
@@ -0,0 +1,162 @@
+"""Versões dos dados e atualização incremental, sem reiniciar o aplicativo.
+
+Novas rodadas de previsão são publicadas substituindo
+``dados_transformados.csv`` e os ``media_*.csv``. ``versao_atual`` confere a
+assinatura (mtime e tamanho) dos arquivos a cada chamada e, quando algum
+muda de conteúdo, monta uma nova ``Versao`` relendo só o que mudou:
+
+* um ``media_*.csv``: só esse arquivo é lido, e só as partições (safra,
+  cultivo, modelo) do cultivo e período dele têm a média juntada de novo;
+* ``dados_transformados.csv``: o CSV é relido e só as partições cujo conteúdo
+  mudou (ou que surgiram ou sumiram) são substituídas;
+* a lista de cidades da região ou o armazém colunar: tudo é recarregado.
+
+A versão nova é montada fora do caminho das sessões e trocada de uma vez.
+Cada sessão do aplicativo guarda a versão que encontrou ao abrir (em
+``st.session_state``) e continua com ela; só sessões novas pegam a nova.
+As partições não substituídas mantêm a versão (``ConsultaIndexada.
+versao_particao``), então as figuras delas continuam válidas no cache.
+"""
+import itertools
+import logging
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+from cache_figuras import limpar_caches
+from consultas import CHAVES_PARTICAO, CHAVES_PREVISOES, ConsultaIndexada, concatenar
+from dados import (
+    ARQUIVO_PREVISOES,
+    ARQUIVOS_MEDIAS,
+    arquivos_previsoes,
+    assinatura_arquivo,
+    hash_arquivo,
+    juntar_medias,
+    ler_media_csv,
+    ler_medias,
+    ler_previsoes,
+    ler_previsoes_csv,
+)
+
+Versao = namedtuple("Versao", ["numero", "consulta", "medias", "hashes", "assinaturas"])
+
+logger = logging.getLogger(__name__)
+
+_numeros = itertools.count(1)
+_atual = None
+_trava = threading.Lock()
+
+
+def _carregar_completa(arquivos, assinaturas):
+    return Versao(
+        numero=next(_numeros),
+        consulta=ConsultaIndexada(ler_previsoes(), CHAVES_PREVISOES, CHAVES_PARTICAO),
+        medias=ler_medias(),
+        hashes={a: hash_arquivo(a) for a in arquivos},
+        assinaturas=assinaturas,
+    )
+
+
+def _assinatura_conteudo(df, colunas):
+    return pd.util.hash_pandas_object(df[colunas], index=False).to_numpy()
+
+
+def particoes_alteradas(consulta, df):
+    """Partições de ``df`` que diferem das de ``consulta``, incluindo as que sumiram."""
+    colunas = list(consulta.df.columns)
+    antigas = consulta.particoes()
+    novas = dict(iter(df.groupby(list(CHAVES_PARTICAO), sort=False, observed=True)))
+
+    alteradas = set(antigas) ^ set(novas)
+    for particao in set(antigas) & set(novas):
+        antiga, nova = antigas[particao], novas[particao]
+        if len(antiga) != len(nova) or not (
+            _assinatura_conteudo(antiga, colunas) == _assinatura_conteudo(nova, colunas)
+        ).all():
+            alteradas.add(particao)
+    return alteradas
+
+
+def _substituir_medias(medias, arquivo):
+    variavel, cultivo, periodo = ARQUIVOS_MEDIAS[arquivo]
+    do_arquivo = (
+        (medias["variavel"] == variavel) & (medias["cultivo"] == cultivo) & (medias["periodo"] == periodo)
+    )
+    return concatenar([medias[~do_arquivo], ler_media_csv(arquivo)], ignore_index=True)
+
+
+def _atualizar(atual, arquivos, assinaturas):
+    # Só calcula o hash dos arquivos cuja assinatura mudou
+    hashes = {
+        a: atual.hashes.get(a) if assinaturas[a] == atual.assinaturas.get(a) else hash_arquivo(a)
+        for a in arquivos
+    }
+    mudaram = [a for a in arquivos if hashes[a] != atual.hashes.get(a)]
+    if not mudaram:
+        return atual._replace(assinaturas=assinaturas)
+
+    if set(mudaram) - {ARQUIVO_PREVISOES, *ARQUIVOS_MEDIAS}:
+        logger.info("Dados recarregados por completo (%s)", ", ".join(mudaram))
+        return _carregar_completa(arquivos, assinaturas)
+
+    medias = atual.medias
+    for arquivo in mudaram:
+        if arquivo in ARQUIVOS_MEDIAS:
+            medias = _substituir_medias(medias, arquivo)
+
+    consulta = atual.consulta
+    if ARQUIVO_PREVISOES in mudaram:
+        df = ler_previsoes_csv(medias)
+        particoes = particoes_alteradas(consulta, df)
+    else:
+        # Só as médias mudaram: junta de novo as partições do cultivo e período delas
+        afetados = [ARQUIVOS_MEDIAS[a][1:] for a in mudaram]
+        linhas = pd.MultiIndex.from_frame(consulta.df[["cultivo", "modelo"]]).isin(afetados)
+        df = juntar_medias(consulta.df[linhas].drop(columns="valor_media"), medias)
+        particoes = set(map(tuple, df[list(CHAVES_PARTICAO)].drop_duplicates().to_numpy().tolist()))
+
+    no_df = pd.MultiIndex.from_frame(df[list(CHAVES_PARTICAO)]).isin(list(particoes))
+    logger.info(
+        "Dados atualizados (%s): %d partições substituídas", ", ".join(mudaram), len(particoes)
+    )
+    return Versao(
+        numero=next(_numeros),
+        consulta=consulta.substituir(particoes, df[no_df]),
+        medias=medias,
+        hashes=hashes,
+        assinaturas=assinaturas,
+    )
+
+
+def versao_atual():
+    """Versão mais recente dos dados, atualizada com o que mudou desde a anterior."""
+    global _atual
+
+    arquivos = arquivos_previsoes()
+    assinaturas = {a: assinatura_arquivo(a) for a in arquivos}
+
+    with _trava:
+        if _atual is not None and _atual.assinaturas == assinaturas:
+            return _atual
+
+        if _atual is None or set(_atual.assinaturas) != set(arquivos):
+            nova = _carregar_completa(arquivos, assinaturas)
+        else:
+            nova = _atualizar(_atual, arquivos, assinaturas)
+
+        # Troca atômica: quem já tem a versão anterior continua com ela
+        _atual = nova
+        return nova
+
+
+def descartar_versao():
+    """Esquece a versão atual e os caches calculados a partir dela.
+
+    A próxima ``versao_atual`` lê tudo do disco de novo.
+    """
+    global _atual
+
+    with _trava:
+        _atual = None
+    limpar_caches()